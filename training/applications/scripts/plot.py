@@ -24,6 +24,12 @@ import sys
 import os.path
 import itertools
 
+# Shared iqstream helpers live in the project's scripts directory
+sys.path.append(os.path.join(os.environ.get('OCPI_PROJECT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')), 'scripts'))
+import iqstream
+import spectrum
+
 def main():
     dataType = "real"
     numSamples = -1
@@ -68,9 +74,13 @@ def main():
         print "file is : " + f
         print "data is : " + dataType
         print "num samples is: " + str(numSamples)
-        data = np.fromfile(f, dtype=np.short)
-
-        print "dataLenth: " + str(len(data))
+        if dataType == "complex":
+           # Even int16 words first, as this script has always plotted them
+           data = iqstream.read_iqstream(f, swap_iq=True)
+           print "dataLenth: " + str(2*len(data))
+        else:
+           data = np.fromfile(f, dtype=np.short)
+           print "dataLenth: " + str(len(data))
 
         ax1 = fig.add_subplot(totalPlots, 1, plotCount)
         plotCount += 1
@@ -79,7 +89,7 @@ def main():
         ax1.set_ylabel('Amplitude')
 
         if dataType == "complex":
-           y1 = data[0::2]
+           y1, y2 = iqstream.rails(data)
            print "yLength: " + str(len(y1))
            if (int(numSamples) > 0):
               y1 = y1[:int(numSamples)]
@@ -89,7 +99,6 @@ def main():
            plotCount += 1
            ax2.set_ylabel('Amplitude')
 
-           y2 = data[1::2]
            if (int(numSamples) > 0):
               y2 = y2[:int(numSamples)]
            x2 = range(len(y2))
@@ -97,19 +106,15 @@ def main():
            ax2.plot(x2,y2, c='r', label='I')
            leg2 = ax2.legend()
 
-           complex_data = np.array(np.zeros(len(data)/2), dtype=np.complex64)
-           j=0
-           for i in xrange(0,len(data)-1,2):
-              complex_data[j] = complex(data[i], data[i+1])
-              j+=1
-           FFT = abs(np.fft.fft(complex_data))
-           bins = np.fft.fftfreq(complex_data.size,0.01)
+           # Averaged (Welch) spectrum, streamed from the mapped file
+           psd = spectrum.welch(data, 4096, 100)
+           bins, FFT = psd.shifted()
            fft_fig = plt.figure(2)
            ax3 = fft_fig.add_subplot(1, 1, 1)
-           ax3.set_title(str(complex_data.size) + '-Point Complex FFT')
+           ax3.set_title(str(psd.nfft) + '-Point Complex FFT, ' + str(psd.segments) + ' averages')
            ax3.set_xlabel('Frequency (Hz)')
            ax3.set_ylabel('Power (dBm)')
-           ax3.plot(bins,20*np.log10(FFT))
+           ax3.plot(bins,10*np.log10(FFT))
 
         else:
            y = data
@@ -118,14 +123,14 @@ def main():
            x = range(len(y))
            ax1.plot(x,y, c='r', label='rData')
 
-           FFT = abs(np.fft.fft(y))
-           bins = np.fft.fftfreq(y.size,0.01)
+           psd = spectrum.welch(y, 4096, 100)
+           bins, FFT = psd.shifted()
            fft_fig = plt.figure(2)
            ax3 = fft_fig.add_subplot(1, 1, 1)
-           ax3.set_title(str(y.size) + '-Point Real FFT')
+           ax3.set_title(str(psd.nfft) + '-Point Real FFT, ' + str(psd.segments) + ' averages')
            ax3.set_xlabel('Frequency (Hz)')
            ax3.set_ylabel('Power (dBm)')
-           ax3.plot(bins,20*np.log10(FFT))
+           ax3.plot(bins,10*np.log10(FFT))
 
 
         leg = ax1.legend()
@@ -0,0 +1,134 @@
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of OpenCPI <http://www.opencpi.org>
+#
+# OpenCPI is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# OpenCPI is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+AGC Complex: Bit-exact model of the agc primitive (hdl/primitives/prims/agc).
+
+Every register of agc.vhd is modelled with the primitive's widths for one
+valid input per step, so the model produces the same word the worker writes
+for every input word, including the 3-sample pipeline latency and the reset
+values (DOUT = 0, gain = GAIN_UNITY). With DIN_VLD asserted on every input
+sample and HOLD low:
+
+  data:   agc_in <= DIN;  DOUT <= agc_out
+  detect: pk_abs <= |agc_out|;  pk_acc <= pk_abs + pk_sum
+          pk_sum = pk_acc - delay(NAVG);  pk_sum_p <= pk_sum
+          pk_avg <= sign & 15 LSBs of (pk_sum_p / NAVG)
+  gain:   err <= REF - pk_avg;  delta_gain <= err*MU
+          gain = gain_d + (delta_gain >> (GAIN_SIZE-1));  gain_d <= gain
+  VGA:    vga_out <= gain_d*agc_in;  agc_out = sign & bits 41..27 of vga_out
+
+Arithmetic wraps at each signal's width as numeric_std does, shifts are
+arithmetic and '/' truncates toward zero. The output of the model lines up
+with the output file word for word (no shifting as with the float model),
+so it can be compared for exact equality over whole arrays.
+"""
+import numpy as np
+
+DATA_WIDTH = 16
+NAVG       = 16
+GAIN_SIZE  = 4
+
+def wrap(v, bits):
+    """Two's complement wrap of a Python int to a signed width"""
+    v &= (1 << bits) - 1
+    return v - (1 << bits) if v >> (bits-1) else v
+
+def initial_regs(navg=NAVG, width=DATA_WIDTH):
+    """Register values after reset"""
+    return {'agc_in':0, 'dout':0, 'pk_abs':0, 'pk_acc':0, 'pk_sum_p':0,
+            'pk_avg':0, 'err':0, 'delta_gain':0, 'vga_out':0,
+            'gain_d':1 << (width-(GAIN_SIZE+1)), # GAIN_UNITY
+            'delay':[0]*(navg+1), 'pos':0}
+
+def agc_fixed_kernel(din, regs, ref, mu, navg=NAVG, width=DATA_WIDTH):
+    """Clock one rail of the primitive once per input word.
+
+    din is a list of ints, regs the register state (initial_regs() after
+    reset) and ref/mu the REF/MU property values. Returns (dout, gains, regs)
+    where dout[n] is the DOUT word presented with input n and gains[n] the
+    gain_d register (s4.27) at that time.
+    """
+    vga_w = 3*width
+    pdet_w = width
+    gain_w = 2*width
+    sum_w = pdet_w + navg
+    lsbs = (1 << (width-1)) - 1
+    lo = vga_w - (GAIN_SIZE+width+1)
+    shift = GAIN_SIZE - 1
+    ref = wrap(ref, width)
+    mu = wrap(mu, width)
+
+    agc_in = regs['agc_in']; dout = regs['dout']; pk_abs = regs['pk_abs']
+    pk_acc = regs['pk_acc']; pk_sum_p = regs['pk_sum_p']; pk_avg = regs['pk_avg']
+    err = regs['err']; delta_gain = regs['delta_gain']; vga_out = regs['vga_out']
+    gain_d = regs['gain_d']; delay = list(regs['delay']); pos = regs['pos']
+    ndelay = navg + 1
+
+    out = [0] * len(din)
+    gains = [0] * len(din)
+    for n in range(len(din)):
+        out[n] = dout
+        gains[n] = gain_d
+        # combinational
+        agc_out = ((vga_out >> lo) & lsbs) - (lsbs + 1 if vga_out < 0 else 0)
+        pk_sum = wrap(pk_acc - delay[pos], sum_w)
+        q = abs(pk_sum_p) // navg
+        pk_avg_f = -q if pk_sum_p < 0 else q
+        gain = wrap(gain_d + (delta_gain >> shift), gain_w)
+        # registers
+        delay[pos] = pk_abs
+        pos += 1
+        if pos == ndelay:
+            pos = 0
+        pk_acc = wrap(pk_abs + pk_sum, sum_w)
+        pk_abs = wrap(abs(agc_out), pdet_w)
+        pk_sum_p = pk_sum
+        vga_out = gain_d * agc_in
+        gain_d = gain
+        delta_gain = err * mu
+        err = wrap(ref - pk_avg, pdet_w)
+        pk_avg = (pk_avg_f & lsbs) - (lsbs + 1 if pk_avg_f < 0 else 0)
+        dout = agc_out
+        agc_in = din[n]
+
+    regs = {'agc_in':agc_in, 'dout':dout, 'pk_abs':pk_abs, 'pk_acc':pk_acc,
+            'pk_sum_p':pk_sum_p, 'pk_avg':pk_avg, 'err':err,
+            'delta_gain':delta_gain, 'vga_out':vga_out, 'gain_d':gain_d,
+            'delay':delay, 'pos':pos}
+    return out, gains, regs
+
+def agc_fixed_stream(din, chunk_size, ref, mu, navg=NAVG, width=DATA_WIDTH):
+    """Model the worker over an iqstream input one chunk at a time.
+
+    Yields (start, dout, gain) where dout is a complex128 array of the
+    expected output words din[start:start+chunk_size] produce (I in .real,
+    Q in .imag) and gain the gain_d registers as floats (s4.27 / 2**27).
+    """
+    state = [initial_regs(navg, width), initial_regs(navg, width)]
+    gain_scale = 1.0 / (1 << (2*width - GAIN_SIZE - 1)) # s4.27 fraction bits
+    for begin in range(0, len(din), chunk_size):
+        block = din[begin:begin+chunk_size]
+        y = np.zeros(len(block), dtype=np.complex128)
+        gain = np.zeros(len(block), dtype=np.complex128)
+        for k, field in enumerate(('real_idx', 'imag_idx')):
+            out, gains, state[k] = agc_fixed_kernel(block[field].tolist(), state[k],
+                                                    ref, mu, navg, width)
+            (y.real if k == 0 else y.imag)[:] = out
+            (gain.real if k == 0 else gain.imag)[:] = gains
+        yield begin, y, gain * gain_scale
@@ -0,0 +1,503 @@
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of OpenCPI <http://www.opencpi.org>
+#
+# OpenCPI is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# OpenCPI is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+AGC Complex: Python reference model of the AGC loop used by verify.py.
+
+Each rail (I and Q) is an independent loop:
+- detect the output level as the mean of |y| over the last Navg outputs
+- err = Ref - detected level
+- gain += err*Mu, limited to +/-maxint
+- y = rint(gain * x)
+
+The detector is kept as a running sum of |y| (add the newest output, drop the
+oldest) instead of re-summing the Navg-sample window for every sample, and the
+recursion runs over plain Python floats/ints rather than indexing numpy arrays
+one element at a time, which is where nearly all of the old model's time went.
+
+Because the loop state is only the gain and the last Navg outputs, a long
+capture can also be split into segments that are verified independently
+(verify_segment), each one re-seeded from the UUT's own output at its start.
+
+The float model is the default. agc_fixed.py holds a bit-exact model of the
+agc primitive for exact comparisons; cached_agc_stream(model='fixed') runs it.
+
+Ref and Mu come from the worker's ref/mu properties when the test sets them
+(OCPI_TEST_ref/OCPI_TEST_mu), and a model run can be cached on disk in a
+directory of the caller's choosing (cached_agc_stream), so re-verifying the
+same input for another platform reuses the expected output instead of
+recomputing it.
+"""
+import math
+import numpy as np
+import sys
+import os.path
+
+# Shared iqstream helpers live in the project's scripts directory
+sys.path.append(os.path.join(os.environ.get('OCPI_PROJECT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')), 'scripts'))
+import iqstream
+import agc_fixed
+
+Navg   = 16
+maxint = pow(2,Navg-1)-1
+# Pipeline latency of the agc primitive: din[j] comes out as dout[j+LATENCY].
+# The comparisons take a shift for workers whose latency differs from this.
+LATENCY = 3
+
+def default_ref():
+    return 0.3*maxint/np.sqrt(2)
+
+def default_mu(ref):
+    return 1/(4*(maxint-ref))
+
+# ref/mu property values of agc_complex-test.xml, used when the test does not
+# pass them on
+TEST_REF = 0x1B26
+TEST_MU  = 0x144E
+
+def ref_from_property(ref):
+    """ref property (s0.15) as a detector level in LSBs"""
+    return float(ref)
+
+def mu_from_property(mu, navg=Navg):
+    """mu property (s0.15) as the float loop coefficient.
+
+    The primitive computes err*mu (ss0.30) and shifts it right by
+    GAIN_SIZE-1 = 3 into the s4.27 gain, i.e. a gain step of err*mu/2**30.
+    """
+    return mu / float(2**(2*(navg-1)))
+
+def loop_params(environ, navg=Navg):
+    """(Ref, Mu) from OCPI_TEST_ref/OCPI_TEST_mu, or the test's values if unset"""
+    ref = environ.get('OCPI_TEST_ref')
+    ref = ref_from_property(TEST_REF if ref is None else int(ref, 0))
+    mu = environ.get('OCPI_TEST_mu')
+    mu = mu_from_property(TEST_MU if mu is None else int(mu, 0), navg)
+    return ref, mu
+
+def property_params(environ):
+    """(ref, mu) property values from OCPI_TEST_ref/OCPI_TEST_mu, or the
+    test's values if unset"""
+    ref = environ.get('OCPI_TEST_ref')
+    ref = TEST_REF if ref is None else int(ref, 0)
+    mu = environ.get('OCPI_TEST_mu')
+    mu = TEST_MU if mu is None else int(mu, 0)
+    return ref, mu
+
+def rint(v):
+    """Round half to even, matching np.rint, for a Python float"""
+    r = math.floor(v)
+    d = v - r
+    if d > 0.5 or (d == 0.5 and r % 2):
+        r += 1
+    return int(r)
+
+def agc_kernel(x, gain, hist, ref, mu, navg=Navg, limit=maxint):
+    """Run one rail of the AGC loop over the input samples x.
+
+    gain is the loop gain before the first sample and hist the last navg
+    outputs (oldest first). Returns (y, gains, gain, hist) where y/gains are
+    lists with one entry per input sample and gain/hist is the loop state to
+    pass to the next call.
+    """
+    y = [0] * len(x)
+    gains = [0.0] * len(x)
+    hist = list(hist)
+    total = sum(abs(v) for v in hist)
+    pos = 0
+    scale = 1.0/navg
+    for k in range(len(x)):
+        gain += (ref - total*scale)*mu
+        if gain > limit:
+            gain = float(limit)
+        elif gain < -limit:
+            gain = float(-limit)
+        yk = rint(gain * x[k])
+        total += abs(yk) - abs(hist[pos])
+        hist[pos] = yk
+        pos += 1
+        if pos == navg:
+            pos = 0
+        y[k] = yk
+        gains[k] = gain
+    return y, gains, gain, hist[pos:] + hist[:pos]
+
+def initial_state(navg=Navg):
+    """Loop state before the first sample: gain 1+0j, empty detector history.
+
+    The gain matches the original complex64 np.ones() gain array (unity on I,
+    zero on Q).
+    """
+    return [(1.0, [0]*navg), (0.0, [0]*navg)]
+
+def agc_rails(x, state, ref, mu, navg=Navg):
+    """Run both rails of the loop over the complex chunk x.
+
+    Returns (y, gain, state) with one output/gain per input sample and the
+    loop state to carry into the next chunk.
+    """
+    y = np.zeros(len(x), dtype=np.complex128)
+    gain = np.zeros(len(x), dtype=np.complex128)
+    new_state = []
+    for out, g_out, x_rail, (g, hist) in ((y.real, gain.real, x.real, state[0]),
+                                         (y.imag, gain.imag, x.imag, state[1])):
+        yr, gr, g, hist = agc_kernel(x_rail.astype(np.float64).tolist(), g, hist,
+                                     ref, mu, navg)
+        out[:] = yr
+        g_out[:] = gr
+        new_state.append((g, hist))
+    return y, gain, new_state
+
+def agc_model(x, ref=None, mu=None, navg=Navg):
+    """Model both rails of the AGC for the complex input x.
+
+    x is indexed as in verify.py (x[0] is the extra leading 'zero' word).
+    Returns (y, gain) with y of length len(x)+1, where y[i+1] is the output
+    for input x[i], and gain the per-sample loop gain. The loop starts at
+    i = navg-1, as the original model did.
+    """
+    if ref is None:
+        ref = default_ref()
+    if mu is None:
+        mu = default_mu(ref)
+    num_samples = len(x)
+    y = np.zeros(num_samples+1, dtype=np.complex128)
+    gain = np.ones(num_samples, dtype=np.complex128)
+    if num_samples >= navg:
+        y[navg:], gain[navg-1:], _ = agc_rails(x[navg-1:], initial_state(navg),
+                                               ref, mu, navg)
+    return y, gain
+
+def agc_stream(din, chunk_size, ref=None, mu=None, navg=Navg, start=0, stop=None, state=None):
+    """Model the AGC over an iqstream input one chunk at a time.
+
+    din is the (memory-mapped) input capture. Yields (start, y, gain) for
+    each chunk of chunk_size model indices, where y[k]/gain[k] are
+    agc_model()'s y[start+k+1]/gain[start+k] for the same (x[0] = 0 shifted)
+    input. The detector history and gain are carried across chunks, so only
+    one chunk of input and model output is held in memory at a time.
+
+    start/stop/state run only model indices [start, stop) from the given loop
+    state (see seed_state); by default the whole capture is run from
+    initial_state().
+    """
+    if ref is None:
+        ref = default_ref()
+    if mu is None:
+        mu = default_mu(ref)
+    if state is None:
+        state = initial_state(navg)
+    if stop is None:
+        stop = len(din)
+    for begin in range(start, stop, chunk_size):
+        end = min(begin + chunk_size, stop)
+        # x[i] = din[i-1]; x[0] is the extra leading 'zero' word
+        x = np.zeros(end-begin, dtype=np.complex128)
+        lo = max(begin, 1)
+        x.real[lo-begin:] = din['real_idx'][lo-1:end-1]
+        x.imag[lo-begin:] = din['imag_idx'][lo-1:end-1]
+        y = np.zeros(end-begin, dtype=np.complex128)
+        gain = np.ones(end-begin, dtype=np.complex128)
+        # the loop starts at i = navg-1; before that y = 0 and the gain is idle
+        first = min(max(begin, navg-1) - begin, end-begin)
+        if first < end-begin:
+            y[first:], gain[first:], state = agc_rails(x[first:], state, ref, mu, navg)
+        yield begin, y, gain
+
+def seed_state(din, dout, i, navg=Navg, shift=0):
+    """Estimate the loop state just before model index i from the UUT output.
+
+    The detector history is the UUT's last navg outputs (y[i-navg+1..i] is
+    dout[i-navg+2..i+1], plus shift); the gain is the least-squares ratio of
+    those outputs to the inputs that produced them. Needs i+shift > navg.
+    """
+    state = []
+    lo = i - navg + 2 + shift
+    for field in ('real_idx', 'imag_idx'):
+        hist = dout[field][lo:lo+navg].astype(np.int64).tolist()
+        x = din[field][i-navg-1:i-1].astype(np.float64)
+        o = dout[field][lo:lo+navg].astype(np.float64)
+        den = np.dot(x, x)
+        state.append((float(np.dot(o, x)/den) if den else 0.0, hist))
+    return state
+
+class SettlingDetector(object):
+    """Finds where the loop has settled from the model's I-rail gain.
+
+    Model index i is compared only when
+    - the total variation of the gain over [i-lookback, i+lookback] is below
+      threshold*|gain[i]|, i.e. the loop is neither still converging nor
+      about to react to a step in the input level,
+    - it is at least lookback past the first modelled sample, and
+    - it is at least guard samples past the last model output that reached
+      the rails of the 16-bit output word: the UUT wraps outputs beyond them,
+      which disturbs its detector in a way the float model does not follow.
+    guard defaults to 32 loop time constants, 32/(Mu*Ref).
+
+    The gain is taken as float32 and outputs at or beyond +/-maxint count as
+    overflows, so a run replayed from the cache (see dt_trace) settles at the
+    same samples as the live one.
+
+    The test needs lookback samples of gain after i, so push() holds each
+    chunk back until the next one arrives and returns the chunks that are
+    ready as (start, y, mask); flush() returns the last one.
+    """
+    def __init__(self, ref, mu, first=Navg-1, lookback=4*Navg, threshold=3e-4, guard=None):
+        self.first = first
+        self.lookback = lookback
+        self.threshold = threshold
+        self.guard = int(32/(mu*ref)) if guard is None else guard
+        self.last_overflow = None
+        self.tail = np.zeros(0, dtype=np.float32)
+        self.pending = None
+
+    def push(self, start, y, gain):
+        ready = []
+        if self.pending is not None:
+            ready.append(self._settled(gain.real[0:self.lookback].astype(np.float32)))
+        self.pending = (start, y, gain.real.astype(np.float32))
+        return ready
+
+    def flush(self):
+        if self.pending is None:
+            return []
+        ready = [self._settled(np.zeros(0, dtype=np.float32))]
+        self.pending = None
+        return ready
+
+    def _settled(self, ahead):
+        start, y, gain = self.pending
+        n = len(gain)
+        L = self.lookback
+        g = np.concatenate((self.tail, gain, ahead))
+        pre = len(self.tail)
+        # total variation over [i-L, i+L] from a running sum of |delta gain|
+        tv = np.concatenate(([0.0], np.cumsum(np.abs(np.diff(g)), dtype=np.float64)))
+        idx = np.arange(pre, pre+n)
+        lo = np.maximum(idx - L, 0)
+        hi = np.minimum(idx + L, len(g) - 1)
+        mask = (tv[hi] - tv[lo]) < self.threshold*np.abs(gain)
+        index = np.arange(start, start+n)
+        mask &= index >= self.first + L
+        # outputs the UUT had to wrap, and how long ago the last one was
+        overflow = np.where(np.abs(y.real) >= maxint, index, -1)
+        if self.last_overflow is not None:
+            overflow[0] = max(overflow[0], self.last_overflow)
+        last = np.maximum.accumulate(overflow)
+        mask &= (last < 0) | (index - last >= self.guard)
+        if last[-1] >= 0:
+            self.last_overflow = last[-1]
+        self.tail = g[max(pre+n-L, 0):pre+n]
+        return start, y, mask
+
+class MismatchReport(object):
+    """Mismatch statistics for one rail, accumulated over chunks.
+
+    Every compared sample goes into the error histogram; samples off by more
+    than tol count as mismatches, and the first and the worst of them are
+    kept with their index, expected and UUT values.
+    """
+    edges = [0, 1, 2, 3, 4, 8, 16, 64, 256, 1024]
+    labels = ['0', '1', '2', '3', '4-7', '8-15', '16-63', '64-255', '256-1023', '>=1024']
+
+    def __init__(self, rail, tol=0):
+        self.rail = rail
+        self.tol = tol
+        self.compared = 0
+        self.mismatches = 0
+        self.first = None
+        self.worst = None
+        self.hist = np.zeros(len(self.edges), dtype=np.int64)
+
+    def add(self, index, expected, uut):
+        """Compare expected against uut at the (absolute) sample indices"""
+        err = np.asarray(expected, dtype=np.float64) - uut
+        mag = np.abs(err)
+        self.compared += len(mag)
+        self.hist += np.bincount(np.searchsorted(self.edges, mag, side='right') - 1,
+                                 minlength=len(self.edges))
+        bad = np.nonzero(mag > self.tol)[0]
+        if not len(bad):
+            return 0
+        self.mismatches += len(bad)
+        if self.first is None:
+            k = bad[0]
+            self.first = (index[k], expected[k], uut[k])
+        k = np.argmax(mag)
+        if self.worst is None or mag[k] > abs(self.worst[1] - self.worst[2]):
+            self.worst = (index[k], expected[k], uut[k])
+        return len(bad)
+
+    def merge(self, other):
+        """Fold in the report of a later part of the capture"""
+        self.compared += other.compared
+        self.mismatches += other.mismatches
+        self.hist += other.hist
+        if self.first is None:
+            self.first = other.first
+        if other.worst is not None and (self.worst is None or
+           abs(other.worst[1] - other.worst[2]) > abs(self.worst[1] - self.worst[2])):
+            self.worst = other.worst
+
+    def summary(self):
+        lines = ['%s: %d compared, %d mismatched (tolerance %d)' %
+                 (self.rail, self.compared, self.mismatches, self.tol)]
+        for name, sample in (('first', self.first), ('worst', self.worst)):
+            if sample is not None:
+                i, expected, uut = sample
+                lines.append('  %s mismatch at %d: expected %d, got %d (error %d)' %
+                             (name, i, expected, uut, expected - uut))
+        lines.append('  |error| histogram: ' +
+                     ', '.join('%s:%d' % (l, n) for l, n in zip(self.labels, self.hist) if n))
+        return lines
+
+def uut_window(dout, begin, length):
+    """dout[begin:begin+length] clipped to the capture (begin may be < 0).
+
+    Returns (skip, o) where o[0] is dout[begin+skip].
+    """
+    skip = max(-begin, 0)
+    return skip, dout[begin+skip:max(begin+length, begin+skip)]
+
+def compare_settled(start, y, dout, mask, report, shift=0):
+    """Compare a chunk of the model's I rail with the UUT output.
+
+    y[k] is the model's y[start+k+1] and is compared with
+    dout[start+k+2+shift] wherever mask (from SettlingDetector) is set, in one
+    masked operation. Returns the number of mismatches in the chunk.
+    """
+    skip, o = uut_window(dout, start+2+shift, len(y))
+    mask = mask[skip:skip+len(o)]
+    index = start + skip + np.nonzero(mask)[0]
+    return report.add(index, y.real[skip:skip+len(o)][mask], o['real_idx'][mask])
+
+def compare_exact(start, y, dout, reports, shift=0):
+    """Compare a chunk of the bit-exact model with dout[start+shift:] on both rails.
+
+    reports is the (I, Q) pair of MismatchReports. Returns the number of
+    mismatches in the chunk.
+    """
+    skip, o = uut_window(dout, start+shift, len(y))
+    index = np.arange(start+skip, start+skip+len(o))
+    return (reports[0].add(index, y.real[skip:skip+len(o)], o['real_idx']) +
+            reports[1].add(index, y.imag[skip:skip+len(o)], o['imag_idx']))
+
+def verify_segment(args):
+    """Verify model indices [start, stop) of a capture on its own.
+
+    args is (input file, output file, num_samples, start, stop, chunk_size,
+    ref, mu, warmup, tol, shift) so that it can be handed to a process pool.
+    Unless the segment starts the capture, the model is seeded from the UUT
+    output before start and run up to start before comparing, which lets any
+    error in the estimated gain settle out. The run starts at least the
+    SettlingDetector's guard plus lookback before start and ends lookback
+    after stop, so the detector sees the same gain history and look-ahead
+    around the segment as the serial path does and both compare the same
+    samples.
+    Returns (start, stop, report) with the segment's MismatchReport.
+    """
+    ifile, ofile, num_samples, start, stop, chunk_size, ref, mu, warmup, tol, shift = args
+    din = iqstream.read_iqstream(ifile, count=num_samples)
+    dout = iqstream.read_iqstream(ofile)
+    settling = SettlingDetector(ref, mu)
+    seed = start - max(warmup, settling.guard + settling.lookback)
+    if seed + min(shift, 0) <= Navg:
+        seed, state = 0, None
+    else:
+        state = seed_state(din, dout, seed, shift=shift)
+        settling.first = seed
+    report = MismatchReport('Real', tol)
+    def compare(ready):
+        for begin, y, mask in ready:
+            index = np.arange(begin, begin+len(y))
+            mask = mask & (index >= start) & (index < stop)
+            compare_settled(begin, y, dout, mask, report, shift)
+    end = min(stop + settling.lookback, len(din))
+    for begin, y, gain in agc_stream(din, chunk_size, ref, mu, start=seed, stop=end, state=state):
+        compare(settling.push(begin, y, gain))
+    compare(settling.flush())
+    return start, stop, report
+
+# Bump when the model changes so that stale cached runs are not reused
+MODEL_VERSION = 2
+
+# A cached run keeps what verification uses, 8 bytes per sample: the model
+# output saturated to the UUT's int16 words and the I-rail gain as float32
+dt_trace = np.dtype([('real_idx', np.int16), ('imag_idx', np.int16), ('gain', np.float32)])
+
+def cache_path(ifile, num_samples, ref, mu, navg=Navg, cache_dir=None, model='float'):
+    """Cache file for a model run keyed on (input digest, Ref, Mu, Navg).
+
+    num_samples and the model ('float' or 'fixed') are part of the key too,
+    since verify.py only models that many samples of the input. Caching is
+    opt-in: without a cache_dir this returns None and the input is not read.
+    """
+    if cache_dir is None:
+        return None
+    key = '%s_%d_%s_%r_%r_%d_v%d' % (iqstream.file_digest(ifile), num_samples, model,
+                                     ref, mu, navg, MODEL_VERSION)
+    return os.path.join(cache_dir, '.agc_model.' + key + '.npy')
+
+def cached_agc_stream(din, chunk_size, ref, mu, navg=Navg, cache_file=None, model='float'):
+    """agc_stream() that replays a cached model run when there is one.
+
+    model='fixed' runs agc_fixed.agc_fixed_stream() instead, with ref/mu in
+    property units. Without a cache_file this just runs the model. Otherwise a complete
+    cache is memory-mapped and replayed chunk by chunk; if there is none, the
+    model is run and each chunk is also written to the cache, which is only
+    put in place once the whole run has finished.
+    """
+    if model == 'fixed':
+        stream = agc_fixed.agc_fixed_stream(din, chunk_size, ref, mu, navg)
+    else:
+        stream = agc_stream(din, chunk_size, ref, mu, navg)
+    if cache_file is None:
+        for chunk in stream:
+            yield chunk
+        return
+    if os.path.isfile(cache_file):
+        trace = np.load(cache_file, mmap_mode='r')
+        for begin in range(0, len(trace), chunk_size):
+            chunk = trace[begin:begin+chunk_size]
+            y = np.zeros(len(chunk), dtype=np.complex128)
+            y.real, y.imag = chunk['real_idx'], chunk['imag_idx']
+            yield begin, y, chunk['gain'].astype(np.complex128)
+        return
+    tmp_file = '%s.%d.tmp' % (cache_file, os.getpid())
+    try:
+        trace = np.lib.format.open_memmap(tmp_file, mode='w+', dtype=dt_trace, shape=(len(din),))
+    except (IOError, OSError):
+        trace = None # e.g. read-only input directory: just run the model
+    complete = False
+    try:
+        for begin, y, gain in stream:
+            if trace is not None:
+                trace['real_idx'][begin:begin+len(y)] = np.clip(y.real, -maxint-1, maxint)
+                trace['imag_idx'][begin:begin+len(y)] = np.clip(y.imag, -maxint-1, maxint)
+                trace['gain'][begin:begin+len(y)] = gain.real
+            yield begin, y, gain
+        complete = True
+    finally:
+        if trace is not None:
+            trace.flush()
+            del trace
+            if complete:
+                os.rename(tmp_file, cache_file)
+            else:
+                os.remove(tmp_file)
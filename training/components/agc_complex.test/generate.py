@@ -23,6 +23,11 @@ AGC Complex: Generate test input data (binary data file).
 Generate args:
 - amount to generate (number of complex signed 16-bit samples)
 - target file
+- (optional) amplitude profile of the tone as a fraction of full scale,
+  default '25%@0.2,25%@0.9,25%@0.2,25%@0.3'. Segments are LENGTH@AMP steps,
+  LENGTH@A0>A1 linear ramps or LENGTH@A0>>A1 exponential fades, with LENGTH
+  in samples or percent of the file; a trailing *R repeats the list (see
+  scripts/stimulus.py), e.g. '4096@0.2,4096@0.9*1000' for a soak run.
 
 To test the AGC Complex component, a binary data file is generated containing
 complex signed 16-bit samples with a tone at Fs/16 where the first 1/4 of the
@@ -39,6 +44,14 @@ the UUT output.
 import struct
 import numpy as np
 import sys
+import os.path
+
+# Shared iqstream helpers live in the project's scripts directory
+sys.path.append(os.path.join(os.environ.get('OCPI_PROJECT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')), 'scripts'))
+import iqstream
+import stimulus
+import impairments
 
 print "\n","*"*80
 print "*** Python: AGC Complex ***"
@@ -54,35 +67,22 @@ elif len(sys.argv) < 3:
 num_samples = int(sys.argv[1])
 filename = sys.argv[2]
 
-#Create an input file with a single tone at Fs/16
+#Create an input file with a single tone at Fs/16 shaped by the amplitude
+#profile. The tone repeats every 16 samples, so each constant step is one
+#period tiled.
 Fs = 16
-Ts = 1.0/float(Fs)
-t = np.arange(0,num_samples*Ts,Ts,dtype=np.float)
-real = np.cos(2*np.pi*t)
-imag = np.sin(2*np.pi*t)
-out_data = np.array(np.zeros(num_samples), dtype=np.dtype((np.uint32, {'real_idx':(np.int16,2), 'imag_idx':(np.int16,0)})))
+profile = stimulus.Profile.parse(sys.argv[3] if len(sys.argv) > 3 else
+                                 '25%@0.2,25%@0.9,25%@0.2,25%@0.3', num_samples)
 #must use same gain on both rails to avoid I/Q spectral image
-gain_pt_2 = 32767*0.2 / max(abs(real))
-gain_pt_3 = 32767*0.3 / max(abs(real))
-gain_pt_9 = 32767*0.9 / max(abs(real))
-for i in xrange(0,num_samples/4):
-    out_data['real_idx'][i] = np.rint(real[i] * gain_pt_2)
-    out_data['imag_idx'][i] = np.rint(imag[i] * gain_pt_2)
-for i in xrange(num_samples/4,num_samples/2):
-    out_data['real_idx'][i] = np.rint(real[i] * gain_pt_9)
-    out_data['imag_idx'][i] = np.rint(imag[i] * gain_pt_9)
-for i in xrange(num_samples/2,num_samples*3/4):
-    out_data['real_idx'][i] = np.rint(real[i] * gain_pt_2)
-    out_data['imag_idx'][i] = np.rint(imag[i] * gain_pt_2)
-for i in xrange(num_samples*3/4,num_samples):
-    out_data['real_idx'][i] = np.rint(real[i] * gain_pt_3)
-    out_data['imag_idx'][i] = np.rint(imag[i] * gain_pt_3)
-
-#Save data file
-f = open(filename, 'wb')
-for i in xrange(0,num_samples):
-    f.write(out_data[i])
-f.close()
+#Optional impairments (GENERATE_IMPAIRMENTS, see scripts/impairments.py) need
+#the unquantized tone, so they take the block path instead of tiling
+stage = impairments.from_environ(os.environ)
+if stage is None:
+    with iqstream.IqstreamWriter(filename) as w:
+        stimulus.write_profiled_tone(w, 1, Fs, num_samples, profile, 32767)
+else:
+    blocks = stage.apply_blocks(stimulus.tone_blocks(1, Fs, num_samples, profile))
+    stimulus.write_stimulus(filename, blocks, 32767, rounding=np.rint)
 
 print 'Output filename: ', filename
 print 'Number of samples: ', num_samples
@@ -0,0 +1,119 @@
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of OpenCPI <http://www.opencpi.org>
+#
+# OpenCPI is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# OpenCPI is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+AGC Complex: Checks of the verification model.
+
+Run from this directory with: python -m unittest test_agc_model
+
+The capture is the unit test's own: generate.py's default profile over 32768
+samples, with the bit-exact model of the HDL worker (agc_fixed.py) standing
+in for the UUT, at the ref/mu properties of agc_complex-test.xml.
+"""
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.append(os.path.join(os.environ.get('OCPI_PROJECT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')), 'scripts'))
+import iqstream
+import stimulus
+import align
+import agc_fixed
+import agc_model
+
+NUM_SAMPLES = 32768
+REF = 0x1B26
+MU = 0x144E
+
+class TestCapture(unittest.TestCase):
+    """Writes the capture and its UUT output to a temporary directory"""
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.ifile = os.path.join(cls.tmpdir, 'agc_complex.in')
+        cls.ofile = os.path.join(cls.tmpdir, 'agc_complex.out')
+        profile = stimulus.Profile.parse('25%@0.2,25%@0.9,25%@0.2,25%@0.3', NUM_SAMPLES)
+        with iqstream.IqstreamWriter(cls.ifile) as w:
+            stimulus.write_profiled_tone(w, 1, 16, NUM_SAMPLES, profile, 32767)
+        din = iqstream.read_iqstream(cls.ifile)
+        y = np.concatenate([out for start, out, gain in
+                            agc_fixed.agc_fixed_stream(din, 8192, REF, MU)])
+        iqstream.write_iqstream(cls.ofile, y.real, y.imag)
+        dout = iqstream.read_iqstream(cls.ofile)
+        cls.shift = align.estimate_latency(din, dout, min_lag=0, max_lag=7) - agc_model.LATENCY
+        cls.ref = agc_model.ref_from_property(REF)
+        cls.mu = agc_model.mu_from_property(MU)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def serial(self, chunk_size, mu=None):
+        """The report of verify.py's serial path"""
+        mu = self.mu if mu is None else mu
+        din = iqstream.read_iqstream(self.ifile)
+        dout = iqstream.read_iqstream(self.ofile)
+        report = agc_model.MismatchReport('Real', 2)
+        settling = agc_model.SettlingDetector(self.ref, mu)
+        def compare(ready):
+            for start, y, mask in ready:
+                agc_model.compare_settled(start, y, dout, mask, report, self.shift)
+        for start, y, gain in agc_model.agc_stream(din, chunk_size, self.ref, mu):
+            compare(settling.push(start, y, gain))
+        compare(settling.flush())
+        return report
+
+class TestLoopParams(TestCapture):
+    def test_mu_scale(self):
+        # the primitive's gain step is err*mu/2**30
+        self.assertEqual(agc_model.mu_from_property(MU), MU / 2.0**30)
+
+    def test_float_model_tracks_hdl(self):
+        # the float model at the properties' Mu passes on the HDL output, at
+        # twice or half that Mu it does not
+        self.assertEqual(self.serial(8192).mismatches, 0)
+        for scale in (0.5, 2):
+            self.assertGreater(self.serial(8192, self.mu*scale).mismatches, 0)
+
+class TestVerifySegment(TestCapture):
+    def segmented(self, chunk_size, seg_size):
+        """The merged report of verify.py's VERIFY_PROCESSES path"""
+        report = agc_model.MismatchReport('Real', 2)
+        for start in range(0, NUM_SAMPLES, seg_size):
+            report.merge(agc_model.verify_segment(
+                (self.ifile, self.ofile, NUM_SAMPLES, start, min(start+seg_size, NUM_SAMPLES),
+                 chunk_size, self.ref, self.mu, 256, 2, self.shift))[2])
+        return report
+
+    def test_same_samples(self):
+        for chunk_size, seg_size in ((4096, 4096), (1000, 3000), (4096, 5000), (2048, 7777)):
+            serial = self.serial(chunk_size)
+            segmented = self.segmented(chunk_size, seg_size)
+            self.assertGreater(serial.compared, 0)
+            self.assertEqual(serial.compared, segmented.compared,
+                             'chunk %d, segment %d' % (chunk_size, seg_size))
+            self.assertEqual(serial.mismatches, 0)
+            self.assertEqual(segmented.mismatches, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -39,6 +39,15 @@ the UUT output.
 """
 import numpy as np
 import sys
+import os.path
+
+# Shared iqstream helpers live in the project's scripts directory
+sys.path.append(os.path.join(os.environ.get('OCPI_PROJECT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')), 'scripts'))
+import iqstream
+import align
+import spectrum
+import agc_model
 
 class color:
     PURPLE = '\033[95m'
@@ -68,20 +77,16 @@ elif len(sys.argv) < 4:
 
 num_samples = int(sys.argv[1])
 
-# Read all of input data file as complex int16
+# Map input data file as complex int16
 print 'Input file to validate: ', sys.argv[3]
-ifx = open(sys.argv[3], 'rb')
-din = np.fromfile(ifx, dtype=np.dtype((np.uint32, {'real_idx':(np.int16,2), 'imag_idx':(np.int16,0)})), count=-1)
-ifx.close()
+din = iqstream.read_iqstream(sys.argv[3])
 
-# Read all of output data file as complex int16
+# Map output data file as complex int16
 print 'Output file to validate: ', sys.argv[2]
-ofx = open(sys.argv[2], 'rb')
-dout = np.fromfile(ofx, dtype=np.dtype((np.uint32, {'real_idx':(np.int16,2), 'imag_idx':(np.int16,0)})), count=-1)
-ofx.close()
+dout = iqstream.read_iqstream(sys.argv[2])
 
 # Ensure dout is not all zeros
-if all(dout == 0):
+if (dout == 0).all():
     print color.RED + color.BOLD + 'FAILED, values are all zero' + color.END
     sys.exit(1)
 # Ensure that dout is the expected amount of data
@@ -90,104 +95,104 @@ if len(dout) != num_samples:
     print color.RED + color.BOLD + 'Length dout = ', len(dout), 'while expected length is = ' + color.END, num_samples
     sys.exit(1)
 
-# Create complex arrays for both input and outputd data
-i_complex_data = np.array(np.zeros(num_samples), dtype=np.complex64)
-o_complex_data = np.array(np.zeros(num_samples), dtype=np.complex64)
+# Ensure the Fs/16 tone is still present: it must hold most of the output energy
+tone = spectrum.measure(dout, [1.0/16]).fraction()[0]
+if tone <= 0.5:
+    print color.RED + color.BOLD + 'FAILED, Fs/16 tone holds only %.1f%% of the output energy' % (100*tone) + color.END
+    sys.exit(1)
+print 'Fs/16 tone holds %.1f%% of the output energy' % (100*tone)
+
+# The model and comparison run in chunks of this many samples. The AGC loop
+# state (gain and the last Navg outputs) is carried from one chunk to the
+# next, so memory stays bounded regardless of capture length.
+chunk_size = int(os.environ.get('VERIFY_CHUNK_SIZE', 65536))
 
-# For AV v1.2: Start at 1 to have an extra 'zero' word at the beginning to align with o_complex_data
+# For AV v1.2: the model input has an extra 'zero' word at the beginning to align with dout
 # For AV post-v1.2: Start at 0, but VHDL must be modified to skip first output sample (SOM and not VALID)
-for i in xrange(1,num_samples):
-    i_complex_data[i] = complex(din['real_idx'][i-1], din['imag_idx'][i-1])
-
-for i in xrange(0,num_samples):
-    o_complex_data[i] = complex(dout['real_idx'][i], dout['imag_idx'][i])
-
-print 'Real Input Avg  =  ', np.mean(i_complex_data.real)
-print 'Imag Input Avg  =  ', np.mean(i_complex_data.imag)
-print 'Real Output Avg =  ', np.mean(o_complex_data.real)
-print 'Imag Output Avg =  ', np.mean(o_complex_data.imag)
-
-# Perform the AGC function on the input data
-Navg   = 16
-maxint = pow(2,Navg-1)-1
-Ref    = 0.3*maxint/np.sqrt(2)
-Mu     = 1/(4*(maxint-Ref))
-
-# initial values
-det_buf = np.array(np.zeros(Navg), dtype=np.complex64)          # buffer to measure output signal
-gain    = np.array(np.ones(num_samples), dtype=np.complex64)    # loop gain
-err     = np.array(np.zeros(num_samples), dtype=np.complex64)   # loop error
-ydet    = np.array(np.zeros(num_samples), dtype=np.complex64)   # output detected
-y       = np.array(np.zeros(num_samples+1), dtype=np.complex64) # output
-
-for i in xrange(Navg-1,num_samples): # lagging by Navg samples
-    # detecting output level
-    det_buf.real = y.real[i+1-Navg:i+1] # buffering
-    det_buf.imag = y.imag[i+1-Navg:i+1] # buffering
-    ydet.real[i] = sum(abs(det_buf.real))/Navg
-    ydet.imag[i] = sum(abs(det_buf.imag))/Navg
-
-    # compare to reference
-    err.real[i] = Ref - ydet.real[i]
-    err.imag[i] = Ref - ydet.imag[i]
-
-    # correct the gain to VGA
-    gain.real[i] = gain.real[i-1] + err.real[i]*Mu
-    if abs(gain.real[i]) > maxint: # limit to max
-        gain.real[i] = (gain.real[i]>=maxint)*maxint + (gain.real[i]< maxint)*(-maxint)
-    gain.imag[i] = gain.imag[i-1] + err.imag[i]*Mu
-    if abs(gain.imag[i]) > maxint: # limit to max
-        gain.imag[i] = (gain.imag[i]>=maxint)*maxint + (gain.imag[i]< maxint)*(-maxint)
-
-    # VGA, variable gain amplifier
-    y.real[i+1] = np.rint(gain.real[i] * i_complex_data.real[i])
-    y.imag[i+1] = np.rint(gain.imag[i] * i_complex_data.imag[i])
-
-# compare python AGC (y) to UUT output (o_complex_data)
-for i in xrange(Navg-1+384,num_samples/4):
-    if abs(y.real[i+1] - o_complex_data.real[i+2]) > 2:
-        print color.RED + color.BOLD + 'FAILED Real' + color.END, i, y.real[i+1], o_complex_data.real[i+2], y.real[i+1]-o_complex_data.real[i+2]
-        print color.RED + color.BOLD + '*** Error: End Validation ***\n' + color.END
-        sys.exit(1)
-    '''
-    if abs(y.imag[i+1] - o_complex_data.imag[i+2]) > 2:
-        print color.RED + color.BOLD + 'FAILED Imag' + color.END, i, y.imag[i+1], o_complex_data.imag[i+2], y.imag[i+1]-o_complex_data.imag[i+2]
-        print color.RED + color.BOLD + '*** Error: End Validation ***\n' + color.END
-        sys.exit(1)
-    '''
-for i in xrange(num_samples/4+896,num_samples/2):
-    if abs(y.real[i+1] - o_complex_data.real[i+2]) > 2:
-        print color.RED + color.BOLD + 'FAILED Real' + color.END, i, y.real[i+1], o_complex_data.real[i+2], y.real[i+1]-o_complex_data.real[i+2]
-        print color.RED + color.BOLD + '*** Error: End Validation ***\n' + color.END
-        sys.exit(1)
-    '''
-    if abs(y.imag[i+1] - o_complex_data.imag[i+2]) > 2:
-        print color.RED + color.BOLD + 'FAILED Imag' + color.END, i, y.imag[i+1], o_complex_data.imag[i+2], y.imag[i+1]-o_complex_data.imag[i+2]
-        print color.RED + color.BOLD + '*** Error: End Validation ***\n' + color.END
-        sys.exit(1)
-    '''
-for i in xrange(num_samples/2+384,num_samples*3/4):
-    if abs(y.real[i+1] - o_complex_data.real[i+2]) > 2:
-        print color.RED + color.BOLD + 'FAILED Real' + color.END, i, y.real[i+1], o_complex_data.real[i+2], y.real[i+1]-o_complex_data.real[i+2]
-        print color.RED + color.BOLD + '*** Error: End Validation ***\n' + color.END
-        sys.exit(1)
-    '''
-    if abs(y.imag[i+1] - o_complex_data.imag[i+2]) > 2:
-       print color.RED + color.BOLD + 'FAILED Imag' + color.END, i, y.imag[i+1], o_complex_data.imag[i+2], y.imag[i+1]-o_complex_data.imag[i+2]
-        print color.RED + color.BOLD + '*** Error: End Validation ***\n' + color.END
-        sys.exit(1)
-    '''
-for i in xrange(num_samples*3/4+256,num_samples-2):
-    if abs(y.real[i+1] - o_complex_data.real[i+2]) > 2:
-        print color.RED + color.BOLD + 'FAILED Real' + color.END, i, y.real[i+1], o_complex_data.real[i+2], y.real[i+1]-o_complex_data.real[i+2]
-        print color.RED + color.BOLD + '*** Error: End Validation ***\n' + color.END
-        sys.exit(1)
-    '''
-    if abs(y.imag[i+1] - o_complex_data.imag[i+2]) > 2:
-        print color.RED + color.BOLD + 'FAILED Imag' + color.END, i, y.imag[i+1], o_complex_data.imag[i+2], y.imag[i+1]-o_complex_data.imag[i+2]
-        print color.RED + color.BOLD + '*** Error: End Validation ***\n' + color.END
-        sys.exit(1)
-    '''
+print 'Real Input Avg  =  ', din['real_idx'][0:num_samples-1].sum(dtype=np.float64)/num_samples
+print 'Imag Input Avg  =  ', din['imag_idx'][0:num_samples-1].sum(dtype=np.float64)/num_samples
+print 'Real Output Avg =  ', dout['real_idx'].mean(dtype=np.float64)
+print 'Imag Output Avg =  ', dout['imag_idx'].mean(dtype=np.float64)
+
+# The latency from din to dout is measured by cross-correlation rather than
+# assumed, so RCC and HDL workers with different pipelines verify alike. The
+# search stays below half the period of the Fs/16 stimulus tone.
+latency = align.estimate_latency(din[0:num_samples], dout, min_lag=0, max_lag=7)
+shift = latency - agc_model.LATENCY
+print 'Measured latency = ', latency
+
+# The loop parameters follow the ref/mu properties set by the test. Set
+# VERIFY_CACHE_DIR to cache the model run there, keyed on (input digest, Ref,
+# Mu, Navg), so verifying the same input on another platform does not
+# recompute it; without it nothing is cached and the input is not digested.
+# VERIFY_AGC_MODEL=fixed verifies against the bit-exact model of the agc
+# primitive (agc_fixed.py) instead: every sample of both rails must be equal.
+model = os.environ.get('VERIFY_AGC_MODEL', 'float')
+if model == 'fixed':
+    ref, mu = agc_model.property_params(os.environ)
+    print 'Bit-exact model ref = ', ref, ', mu = ', mu
+else:
+    ref, mu = agc_model.loop_params(os.environ)
+    print 'Model Ref = ', ref, ', Mu = ', mu
+cache_file = agc_model.cache_path(sys.argv[3], num_samples, ref, mu, model=model,
+                                  cache_dir=os.environ.get('VERIFY_CACHE_DIR'))
+
+# Every compared sample is checked (there is no early exit) and mismatches
+# are summarized per rail: count, first and worst sample and an |error|
+# histogram.
+def report_chunk(start, stop, compared, mismatched):
+    print 'Samples %d to %d: %d compared, %d mismatched' % (start, stop, compared, mismatched)
+
+# Long captures can be split across VERIFY_PROCESSES worker processes. Each
+# segment is re-seeded from the UUT output just before it starts (see
+# agc_model.verify_segment), so segments are independent of each other.
+processes = int(os.environ.get('VERIFY_PROCESSES', 1))
+if model == 'fixed':
+    # The bit-exact model lines up with dout word for word
+    reports = [agc_model.MismatchReport('Real'), agc_model.MismatchReport('Imag')]
+    for start, y, gain in agc_model.cached_agc_stream(din[0:num_samples], chunk_size, ref, mu,
+                                                      cache_file=cache_file, model=model):
+        before = reports[0].compared + reports[1].compared
+        mismatched = agc_model.compare_exact(start, y, dout, reports, shift)
+        report_chunk(start, start+len(y)-1, reports[0].compared + reports[1].compared - before, mismatched)
+elif processes > 1 and (cache_file is None or not os.path.isfile(cache_file)):
+    import multiprocessing
+    seg_size = max(chunk_size, -(-num_samples // (4*processes)))
+    segments = [(sys.argv[3], sys.argv[2], num_samples, start, min(start+seg_size, num_samples),
+                 chunk_size, ref, mu, 256, 2, shift)
+                for start in range(0, num_samples, seg_size)]
+    pool = multiprocessing.Pool(processes)
+    results = pool.map(agc_model.verify_segment, segments)
+    pool.close()
+    reports = [agc_model.MismatchReport('Real', 2)]
+    for start, stop, report in results:
+        report_chunk(start, stop-1, report.compared, report.mismatches)
+        reports[0].merge(report)
+else:
+    # Perform the AGC function on the input data (or replay the cached run) and
+    # compare python AGC (y[i+1]) to UUT output (dout[i+2]) as each chunk finishes.
+    # Samples where the loop is still settling after a change in input level
+    # are skipped; they are found from the model's gain trajectory, so any
+    # input amplitude profile can be verified.
+    reports = [agc_model.MismatchReport('Real', 2)]
+    settling = agc_model.SettlingDetector(ref, mu)
+    def compare(ready):
+        for start, y, mask in ready:
+            before = reports[0].compared
+            mismatched = agc_model.compare_settled(start, y, dout, mask, reports[0], shift)
+            report_chunk(start, start+len(y)-1, reports[0].compared - before, mismatched)
+    for start, y, gain in agc_model.cached_agc_stream(din[0:num_samples], chunk_size, ref, mu,
+                                                      cache_file=cache_file):
+        compare(settling.push(start, y, gain))
+    compare(settling.flush())
+
+for report in reports:
+    for line in report.summary():
+        print line
+if sum(report.mismatches for report in reports):
+    print color.RED + color.BOLD + 'FAILED, output does not match the model' + color.END
+    print color.RED + color.BOLD + '*** Error: End Validation ***\n' + color.END
+    sys.exit(1)
 
 print 'Data matched expected results.'
 print color.GREEN + color.BOLD + 'PASSED' + color.END
@@ -26,6 +26,8 @@ Generate args:
 3. amplitude of generated sinusoid
 4. number of complex samples to generated
 5. output file
+6. (optional) stimulus scenario, e.g. 'tone:12.5,tone:30:0.5,noise:0.01'
+   (see scripts/stimulus.py); by default a single tone at the center frequency
 
 To test the Complex Mixer, a binary data file is generated containing complex
 signed 16-bit samples with a tone at a configurable center frequency and sample
@@ -37,40 +39,40 @@ the input waveform frequency. The validation of the test involves performing an
 of the output file to ensure the max tone is located at DC or 0 Hz.
 """
 import struct
-import numpy as np
 import sys
 import os.path
 
-if len(sys.argv) != 6:
-    print("Invalid arguments:  usage is: generate.py <sample-freq> <target-freq> <amplitude> <num-samples> <output-file>")
+# Shared stimulus helpers live in the project's scripts directory
+sys.path.append(os.path.join(os.environ.get('OCPI_PROJECT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')), 'scripts'))
+import stimulus
+import impairments
+
+if len(sys.argv) not in (6, 7):
+    print("Invalid arguments:  usage is: generate.py <sample-freq> <target-freq> <amplitude> <num-samples> <output-file> [<scenario>]")
     sys.exit(1)
 print "    GENERATE (I/Q 16b binary data file):"
 
 ofilename = sys.argv[5]
-# Create cosine & sine waveforms
 Fs = float(sys.argv[1])     # sample frequency
-Ts = 1.0/float(Fs);     # sampling interval
 Ft = float(sys.argv[2])     # target frequency
 AMPLITUDE = int(sys.argv[3])
 NUM_SAMPLES = int(sys.argv[4]) # number of complex samples
-t = np.arange(0,NUM_SAMPLES*Ts,Ts,dtype=np.float)   # time vector
-# Generate I/Q samples @ target freq
-real = np.cos(2*np.pi*Ft*t)
-imag = np.sin(2*np.pi*Ft*t)
-# Initialize empty array, sized to store 16b I/Q samples
-z = np.array(np.zeros(NUM_SAMPLES), 
-             dtype=np.dtype((np.uint32, {'real_idx':(np.int16,2), 'imag_idx':(np.int16,0)})))
-# Set the gain
-gain_i = AMPLITUDE / max(abs(real))
-gain_q = AMPLITUDE / max(abs(imag))
-z['real_idx'] = np.int16(real * gain_i)
-z['imag_idx'] = np.int16(imag * gain_q)
+# Generate I/Q samples @ target freq (or the given scenario) from a phase
+# accumulator, block by block, with the stimulus peak at AMPLITUDE
+scenario = stimulus.parse_scenario(sys.argv[6] if len(sys.argv) > 6 else 'tone:%r' % Ft)
+
+# Optional impairments (GENERATE_IMPAIRMENTS, see scripts/impairments.py) are
+# applied to the stimulus normalized to a full scale of 1.0
+stage = impairments.from_environ(os.environ)
 
-# Save data to file
-f = open(ofilename, 'wb')
-for i in xrange(NUM_SAMPLES):
-    f.write(z[i])
-f.close()
+# Save data to file (16b I/Q samples)
+if stage is None:
+    stimulus.write_stimulus(ofilename, scenario.blocks(NUM_SAMPLES, Fs), AMPLITUDE / scenario.peak())
+else:
+    peak = scenario.peak()
+    blocks = stage.apply_blocks(x / peak for x in scenario.blocks(NUM_SAMPLES, Fs))
+    stimulus.write_stimulus(ofilename, blocks, AMPLITUDE)
 
 # Summary
 print '      # of Bytes:', NUM_SAMPLES*4
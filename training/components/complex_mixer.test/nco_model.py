@@ -0,0 +1,175 @@
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of OpenCPI <http://www.opencpi.org>
+#
+# OpenCPI is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# OpenCPI is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Complex Mixer: Sample-level models of the mixer workers used by verify.py.
+
+Three models, each computed for a whole block of samples at once:
+
+'dds'    HDL worker, ENABLE=1: the Xilinx dds_compiler (16-bit phase
+         accumulator, 16-bit sine/cosine, full range) feeding the
+         complex_multiplier, whose 33-bit products are truncated to
+         pr(32 downto 17) & pi(32 downto 17):
+           phase[n] = phase0 + n*phs_inc (mod 2**16)
+           c + js   = rint(32767*exp(j*2*pi*phase[n]/2**16))
+           I + jQ   = ((I*c - Q*s) >> 17) + j((I*s + Q*c) >> 17)
+'nco'    HDL worker, ENABLE=0 and DATA_SELECT=1: the NCO itself, I = c, Q = s.
+'liquid' RCC worker, ENABLE=1: liquid-dsp's LIQUID_NCO (32-bit phase, 1024
+         entry sine table), stepped before each nco_crcf_mix_down() and with
+         the worker's Uscale()/Scale() float conversions.
+
+The HDL pipeline is primed when phs_inc is written, so neither the NCO phase
+at the first sample nor the output latency are fixed; fit() estimates both
+from the start of the output. The models then produce every expected output
+word, so verification is a full-array comparison.
+"""
+import numpy as np
+
+PHASE_WIDTH   = 16
+OUTPUT_WIDTH  = 16
+PRODUCT_SHIFT = 17   # pr(32 downto 17), pi(32 downto 17)
+
+LIQUID_LUT_BITS = 10
+LIQUID_SINTAB   = np.sin(2*np.pi*np.arange(1 << LIQUID_LUT_BITS) /
+                         (1 << LIQUID_LUT_BITS)).astype(np.float32)
+SHRT_MAX = 2**15 - 1
+
+def dds_phase(phs_inc, count, start=0, phase0=0):
+    """dds_compiler phase accumulator for samples [start, start+count)"""
+    n = np.arange(start, start+count, dtype=np.int64)
+    return (phase0 + n*phs_inc) & ((1 << PHASE_WIDTH) - 1)
+
+def dds_sincos(phase):
+    """Full range cosine/sine LUT output for accumulator values"""
+    amp = (1 << (OUTPUT_WIDTH-1)) - 1
+    theta = 2*np.pi*phase/float(1 << PHASE_WIDTH)
+    return (np.rint(amp*np.cos(theta)).astype(np.int64),
+            np.rint(amp*np.sin(theta)).astype(np.int64))
+
+def dds_mix(i, q, phs_inc, start=0, phase0=0):
+    """complex_multiplier output for input rails i/q starting at sample start"""
+    c, s = dds_sincos(dds_phase(phs_inc, len(i), start, phase0))
+    i = np.asarray(i, dtype=np.int64)
+    q = np.asarray(q, dtype=np.int64)
+    return (i*c - q*s) >> PRODUCT_SHIFT, (i*s + q*c) >> PRODUCT_SHIFT
+
+def liquid_frequency(phs_inc):
+    """Phase step of nco_crcf_set_frequency() for the RCC worker's phs_inc"""
+    theta = np.float32(phs_inc * ((2*np.pi)/(SHRT_MAX * 2)))
+    # nco_constrain(), in its float arithmetic:
+    #   float p = theta * 0.159154943091895;
+    #   float fpart = p - ((long)p);
+    #   return (uint32_t)(fpart * 0xffffffff);
+    # (long) truncates toward zero, so fpart keeps the sign of theta, and the
+    # conversion of a negative product wraps modulo 2**32
+    p = np.float32(float(theta) * 0.159154943091895)
+    fpart = np.float32(p - np.float32(int(p)))
+    return int(np.float32(fpart * np.float32(0xffffffff))) & 0xffffffff
+
+def liquid_mix(i, q, phs_inc, start=0):
+    """RCC worker output for input rails i/q starting at sample start"""
+    d_theta = liquid_frequency(phs_inc)
+    # nco_crcf_step() runs before nco_crcf_mix_down(), so sample n sees (n+1) steps
+    n = np.arange(start+1, start+len(i)+1, dtype=np.uint64)
+    theta = (n*np.uint64(d_theta)) & np.uint64(0xffffffff)
+    shift = np.uint64(32 - LIQUID_LUT_BITS)
+    size = 1 << LIQUID_LUT_BITS
+    index = (((theta + (np.uint64(1) << (shift - np.uint64(1)))) >> shift) &
+             np.uint64(size - 1)).astype(np.int64)
+    s = LIQUID_SINTAB[index]
+    c = LIQUID_SINTAB[(index + size//4) % size]
+    # Uscale(): (float)((float)x / (2^15-1))
+    xr = (np.asarray(i, dtype=np.float32) / float(SHRT_MAX)).astype(np.float32)
+    xi = (np.asarray(q, dtype=np.float32) / float(SHRT_MAX)).astype(np.float32)
+    # y = x * conj(c + js)
+    yr = xr*c + xi*s
+    yi = xi*c - xr*s
+    # Scale(): (int16_t)((float)y * (2^15-1)), truncating toward zero
+    return (np.trunc(yr.astype(np.float64)*SHRT_MAX).astype(np.int64).astype(np.int16).astype(np.int64),
+            np.trunc(yi.astype(np.float64)*SHRT_MAX).astype(np.int64).astype(np.int16).astype(np.int64))
+
+def expected(kind, idata, phs_inc, start, count, phase0=0):
+    """Expected (I, Q) output of a model for input samples [start, start+count)"""
+    if kind == 'nco':
+        return dds_sincos(dds_phase(phs_inc, count, start, phase0))
+    block = idata[start:start+count]
+    if kind == 'dds':
+        return dds_mix(block['real_idx'], block['imag_idx'], phs_inc, start, phase0)
+    if kind == 'liquid':
+        return liquid_mix(block['real_idx'], block['imag_idx'], phs_inc, start)
+    raise ValueError("Unknown mixer model '%s'" % kind)
+
+def mismatches(e, o, tol):
+    """Boolean mask of output words differing from the model by more than tol"""
+    return ((np.abs(e[0] - o['real_idx']) > tol) |
+            (np.abs(e[1] - o['imag_idx']) > tol))
+
+def fit(kind, idata, odata, phs_inc, max_lag=7, prefix=4096, tol=0, search=8):
+    """Estimate (latency, phase0) of the worker output from its first samples.
+
+    For each latency up to max_lag the NCO phase offset is first estimated
+    from the angle of the correlation of the output with the model run at
+    phase0 = 0. The output's truncation biases that angle by a few units of
+    the accumulator, so the offsets within +/-search of it are tried nearest
+    first, up to the first that matches every word; the pair with the fewest
+    mismatches over prefix samples wins. The liquid model has no phase
+    offset to fit.
+    """
+    mask = (1 << PHASE_WIDTH) - 1
+    best = None
+    for lag in range(max_lag+1):
+        count = min(prefix, len(idata), len(odata) - lag)
+        if count <= 0:
+            break
+        o = odata[lag:lag+count]
+        candidates = [0]
+        if kind != 'liquid':
+            e = expected(kind, idata, phs_inc, 0, count)
+            z = np.vdot(e[0] + 1j*e[1], o['real_idx'] + 1j*o['imag_idx'].astype(np.float64))
+            estimate = int(round(np.angle(z)/(2*np.pi) * (1 << PHASE_WIDTH)))
+            candidates = [estimate & mask]
+            for r in range(1, search+1):
+                candidates += [(estimate - r) & mask, (estimate + r) & mask]
+        for phase0 in candidates:
+            bad = np.count_nonzero(mismatches(expected(kind, idata, phs_inc, 0, count, phase0), o, tol))
+            if best is None or bad < best[0]:
+                best = (bad, lag, phase0)
+            if not bad:
+                break
+    return best[1], best[2]
+
+def compare(kind, idata, odata, phs_inc, lag, phase0=0, chunk_size=65536, tol=0):
+    """Compare odata[lag:] with the model over the whole capture, in chunks.
+
+    Returns (compared, mismatched, first) where first is the first
+    mismatching output index or None.
+    """
+    total = min(len(idata), len(odata) - lag)
+    compared = 0
+    mismatched = 0
+    first = None
+    for start in range(0, total, chunk_size):
+        count = min(chunk_size, total - start)
+        bad = mismatches(expected(kind, idata, phs_inc, start, count, phase0),
+                         odata[lag+start:lag+start+count], tol)
+        n = np.count_nonzero(bad)
+        if n and first is None:
+            first = lag + start + int(np.argmax(bad))
+        compared += count
+        mismatched += n
+    return compared, mismatched, first
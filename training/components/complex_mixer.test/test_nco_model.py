@@ -0,0 +1,64 @@
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of OpenCPI <http://www.opencpi.org>
+#
+# OpenCPI is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# OpenCPI is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Complex Mixer: Checks of the mixer models.
+
+Run from this directory with: python -m unittest test_nco_model
+"""
+import unittest
+
+import numpy as np
+
+import nco_model
+
+class TestLiquidFrequency(unittest.TestCase):
+    def test_phase_step(self):
+        # d_theta of liquid-dsp's nco_crcf_set_frequency() for the RCC
+        # worker's phs_inc, as computed by nco_constrain() in float
+        for phs_inc, d_theta in ((-8192, 3758080000), (8192, 536887296),
+                                 (1000, 65538000), (-1000, 4229429296), (0, 0)):
+            self.assertEqual(nco_model.liquid_frequency(phs_inc), d_theta,
+                             'phs_inc %d' % phs_inc)
+
+class TestFit(unittest.TestCase):
+    def capture(self, lag, phase0, phs_inc=-8192, count=8192):
+        """A full-scale tone at -phs_inc (as generate.py writes for the test)
+        and the dds model's output for it, lag samples late"""
+        dt = np.dtype([('real_idx', np.int16), ('imag_idx', np.int16)])
+        x = 32767*np.exp(-2j*np.pi*phs_inc*np.arange(count)/2.0**16)
+        idata = np.zeros(count, dtype=dt)
+        idata['real_idx'] = np.rint(x.real)
+        idata['imag_idx'] = np.rint(x.imag)
+        i, q = nco_model.dds_mix(idata['real_idx'], idata['imag_idx'], phs_inc, 0, phase0)
+        odata = np.zeros(count+lag, dtype=dt)
+        odata['real_idx'][lag:] = i
+        odata['imag_idx'][lag:] = q
+        return idata, odata
+
+    def test_dds_exact(self):
+        # the fitted phase reproduces every output word, not just to 1 LSB
+        for phase0 in range(0, 1 << nco_model.PHASE_WIDTH, 1999):
+            idata, odata = self.capture(3, phase0)
+            lag, fitted = nco_model.fit('dds', idata, odata, -8192)
+            self.assertEqual(lag, 3)
+            mismatched = nco_model.compare('dds', idata, odata, -8192, lag, fitted, tol=0)[1]
+            self.assertEqual(mismatched, 0, 'phase0 %d fitted as %d' % (phase0, fitted))
+
+if __name__ == '__main__':
+    unittest.main()
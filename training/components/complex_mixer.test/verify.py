@@ -35,10 +35,17 @@ the input waveform frequency. The validation of the test involves performing an
 of the output file to ensure the max tone is located at DC or 0 Hz.
 """
 import struct
-import numpy as np
 import sys
 import os.path
 
+# Shared iqstream helpers live in the project's scripts directory
+sys.path.append(os.path.join(os.environ.get('OCPI_PROJECT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')), 'scripts'))
+import iqstream
+import align
+import spectrum
+import nco_model
+
 class color:
     PURPLE = '\033[95m'
     CYAN = '\033[96m'
@@ -56,22 +63,20 @@ Ex: python verify.py {sample-freq} {number_of_samples} {ofilename} {ifilename}
 Validate:
 TEST #1: Verify I & Q values are not all zeros
 TEST #2: Output file matches expected size
-TEST #3: Two possibilities: 1) NORMAL MODE - Target tone tuned to DC, 2) BYPASS MODE - idata = odata
+TEST #3: Three possibilities: 1) NORMAL MODE - Target tone tuned to DC (and, with
+         VERIFY_NCO_MODEL, output matches the mixer model), 2) BYPASS MODE -
+         idata = odata, 3) BYPASS MODE with DATA_SELECT - output matches the
+         NCO model (HDL worker only)
 """
 
 if len(sys.argv) != 5:
     print('Invalid arguments:  usage is: verify.py <sample-freq> <num-samples> <output-file> <input-file>')
     sys.exit(1)
-dt_iq_pair = np.dtype((np.uint32, {'real_idx':(np.int16,2), 'imag_idx':(np.int16,0)}))
-# Read all input data as complex int16
-ifilename = open(sys.argv[4], 'rb')
-idata = np.fromfile(ifilename, dtype=dt_iq_pair, count=-1)
-ifilename.close()
+# Map input data as complex int16
+idata = iqstream.read_iqstream(sys.argv[4])
 
-# Read all output data as complex int16
-ofilename = open(sys.argv[3], 'rb')
-odata = np.fromfile(ofilename, dtype=dt_iq_pair, count=-1)
-ofilename.close()
+# Map output data as complex int16
+odata = iqstream.read_iqstream(sys.argv[3])
 
 num_samples = int(sys.argv[2])
 sample_rate = float(sys.argv[1])
@@ -80,76 +85,91 @@ phs_inc = float(os.environ.get('OCPI_TEST_phs_inc'))
 data_select = os.environ.get('OCPI_TEST_data_select')
 
 # Test that odata is not all zeros
-if all(odata == 0):
+if (odata == 0).all():
     print color.RED + color.BOLD + 'FAILED, values are all zero' + color.END
     sys.exit(1)
 else:
     print '      PASS - File is not all zeros'
 
-# Test that odata is the expected amount
-# INCLUDES TRANSIENT and not FLUSHING of pipeline (USE THIS FOR v1.2)
-if len(odata) != len(idata):
-# INCLUDES TRANSIENT and FLUSHING of pipeline (USE THIS FOR v1.2 'ADVANCED')
-#if len(odata)-6 != len(idata):
-# EXCLUDES TRANSIENT and performs FLUSHING of pipeline (USE THIS FOR POST-v1.2 'ADVANCED')
-#if len(odata) != len(idata):
+# In bypass mode the output is the input delayed by the worker's pipeline
+# (0 for v1.2, 6 for v1.2 'ADVANCED' which also flushes the pipeline). The
+# delay is measured by cross-correlation instead of being hard-coded per
+# worker version; the search stays below the 8-sample period of the tone.
+latency = 0
+if enable != 'true' and data_select == 'false':
+    latency = align.estimate_latency(idata, odata, min_lag=0, max_lag=7)
+    print '      Measured latency: ', latency
+
+# Test that odata is the expected amount (plus any flushed pipeline)
+if len(odata) != len(idata) and len(odata)-latency != len(idata):
     print color.RED + color.BOLD + 'FAILED, output file length is unexpected' + color.END
     print color.RED + color.BOLD + 'Length ofilename = ', len(odata), 'while expected length is = ' + color.END, len(idata)
     sys.exit(1)
 else:
     print '      PASS - Input and output file lengths match'
 
+def check_model(kinds):
+    """Compare the whole output with the first of kinds (nco_model) that fits.
+
+    The NCO phase and pipeline latency are fitted on the start of the output,
+    then every output word must equal the model.
+    """
+    for kind in kinds:
+        lag, phase0 = nco_model.fit(kind, idata, odata, phs_inc)
+        compared, mismatched, first = nco_model.compare(kind, idata, odata, phs_inc, lag, phase0)
+        if not mismatched:
+            print '      PASS - Output matches the %s model (latency %d, phase %d): %d samples' % (
+                kind, lag, phase0, compared)
+            return
+        print '      %s model (latency %d, phase %d): %d of %d samples mismatched, first at %d' % (
+            kind, lag, phase0, mismatched, compared, first)
+    print color.RED + color.BOLD + 'FAILED, output does not match the model' + color.END
+    sys.exit(1)
+
+# VERIFY_NCO_MODEL=dds (HDL worker), =liquid (RCC worker) or =dds,liquid
+# (either may match) also compares the mixed output word for word with a
+# model of the worker. Unset, normal mode checks the tone only.
+nco_models = [m for m in os.environ.get('VERIFY_NCO_MODEL', '').split(',') if m]
+phs_inc = int(phs_inc)
+
 if(enable == 'true'): # => NORMAL MODE
-    complex_data = np.array(np.zeros(num_samples), dtype=np.complex)
-    for i in xrange(0,num_samples):
-        complex_data[i] = complex(odata['real_idx'][i], odata['imag_idx'][i])
-    FFT = 1.0/num_samples * abs(np.fft.fft(complex_data,num_samples))
-    Max_FFT_freq=np.argmax(FFT)*sample_rate/num_samples
-    if Max_FFT_freq != 0.0:
-        print 'Fail: Max of FFT occurs at index: ',Max_FFT_freq, 'Hz (Should be 0)'
+    # The tone must be mixed to DC. More than half of the output energy at
+    # 0 Hz means the FFT peak is there, without computing the FFT.
+    dc = spectrum.measure(odata[0:num_samples], [0.0], sample_rate).fraction()[0]
+    if dc <= 0.5:
+        print 'Fail: Tone at 0 Hz holds only %.1f%% of the output energy (Should be the max)' % (100*dc)
         sys.exit(1)
     else:
-        print '      PASS - Max of FFT occurs at index: ',Max_FFT_freq, 'Hz'
+        print '      PASS - Tone at 0 Hz holds %.1f%% of the output energy' % (100*dc)
+    if nco_models:
+        check_model(nco_models)
 else: # => BYPASS MODE
     if (data_select == 'false'):
-# INCLUDES TRANSIENT and not FLUSHING of pipeline (USE THIS FOR v1.2)
-        if (idata != odata).all():
-# INCLUDES TRANSIENT and FLUSHING of pipeline (USE THIS FOR v1.2 'ADVANCED')
-#        if (idata != odata[0:-6]).all():
-# EXCLUDES TRANSIENT and performs FLUSHING of pipeline (USE THIS FOR POST-v1.2 'ADVANCED')
-#        if (idata != odata).all():
+        # Samples before the measured latency are the pipeline transient
+        iref, oref = align.overlap(idata, odata, latency)
+        compared, mismatched, first = iqstream.compare_words(iref, oref)
+        if mismatched:
             print 'Fail - Bypass Mode: Input and output file do not match'
+            print '       first mismatch at output sample %d (%d of %d samples checked mismatched)' % (
+                first + latency, mismatched, compared)
             sys.exit(1)
         else:
             print '      PASS - Bypass Mode: Input and output file match'
-"""
-
-TODO: TEST IS ONLY VALID FOR HDL OUTPUT!
-- NEED TO BLOCK WHEN VERIFYING RCC OUTPUT or NOT RUN CONFIGURATION AGAINST RCC.
-
+    elif iqstream.worker_model(sys.argv[3]) == 'rcc':
+        # The NCO output replaces the data on the HDL worker only: the RCC
+        # worker has no data_select property and no NCO output to check
+        print color.YELLOW + '      SKIP - Bypass Mode: NCO output is only checked for the HDL worker' + color.END
     else:
-        # Calculate NCO tone for mixing with input
-        system_freq = sample_rate
-        phase_acc_width = 16 # Configuration of the Xilinx CORE Generator: DDS module
-        nco_freq = ((system_freq * phs_inc) / (2**phase_acc_width))
-        #print '      NCO freq (calc) = ', nco_freq
-        # Construct complex array of vectors for performing FFT
-        # (PUT FFT INTO ITS OWN FUNCTION)
-        data=np.zeros((len(odata)), dtype=complex)
-        data.real = odata['real_idx']
-        data.imag = odata['imag_idx']
-        # Perform FFT
-        w = np.fft.fft(data)
-        freqs = np.fft.fftfreq(len(w))
-        # Locate max Tone
-        idx = np.argmax(np.abs(w))
-        freq = freqs[idx]
-        #print 'Measured freq \t= ', freq
-        ofreq_hz = freq * system_freq
-        #print '      NCO freq (measured) = ', ofreq_hz
-        if (nco_freq != ofreq_hz):
-            print 'Fail: Bypass Mode: NCO does not match expected freq: %.2f vs %.2f' % (nco_freq, ofreq_hz)
+        # The NCO output replaces the data. Its frequency is checked on one
+        # short block to within a fraction of a bin first, then every word
+        # against the 'nco' model of the dds_compiler.
+        nco_freq = sample_rate * phs_inc / 2**nco_model.PHASE_WIDTH
+        freq, bound = spectrum.estimate_frequency(odata, sample_rate)
+        if abs(freq - nco_freq) > bound:
+            print 'Fail: Bypass Mode: NCO does not match expected freq: %.3f vs %.3f (+/- %.4f) Hz' % (
+                nco_freq, freq, bound)
             sys.exit(1)
         else:
-            print '      PASS - Bypass Mode: NCO output matches expected freq'
-"""
+            print '      PASS - Bypass Mode: NCO output matches expected freq: %.3f (+/- %.4f) Hz' % (
+                freq, bound)
+        check_model(['nco'])
@@ -37,6 +37,13 @@ import numpy as np
 import sys
 import os.path
 
+# Shared iqstream helpers live in the project's scripts directory
+sys.path.append(os.path.join(os.environ.get('OCPI_PROJECT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')), 'scripts'))
+import iqstream
+import stimulus
+import impairments
+
 class color:
     PURPLE = '\033[95m'
     CYAN = '\033[96m'
@@ -61,28 +68,29 @@ def generate(argv):
     filename = argv[2]
     num_samples = int(argv[1])
 
-    #Create an input file with a single tone at 13 Hz; Fs=100 Hz
+    #Create an input file with a single tone at 13 Hz; Fs=100 Hz. The tone
+    #repeats every 100 samples, so one period is computed and tiled.
     Tone13 = 13
     Fs = 100
-    Ts = 1.0/float(Fs)
-    t = np.arange(0,num_samples*Ts,Ts,dtype=np.float)
-    real = np.cos(Tone13*2*np.pi*t)
-    imag = np.sin(Tone13*2*np.pi*t)
-    out_data = np.array(np.zeros(num_samples), dtype=np.dtype((np.uint32, {'real_idx':(np.int16,2), 'imag_idx':(np.int16,0)})))
+    cycle = stimulus.tone_cycle(Tone13, Fs, stimulus.tone_period(Tone13, Fs))
 
     #pick a gain at 95% max value - i.e. back off a little to avoid file
     #generation overflow. This results in complex amplitudes that swing between
     #+31k and -31k within an int16. We must use the same gain on both rails to
     #avoid I/Q spectral image
-    gain = 32768*0.95 / max(abs(real))
-    out_data['real_idx'] = np.int16(real * gain)
-    out_data['imag_idx'] = np.int16(imag * gain)
+    gain = 32768*0.95 / max(abs(cycle.real))
 
-    #Save data file
-    f = open(filename, 'wb')
-    for i in xrange(0,num_samples):
-        f.write(out_data[i])
-    f.close()
+    #Save data file. Optional impairments (GENERATE_IMPAIRMENTS, see
+    #scripts/impairments.py) need the unquantized tone, so they take the
+    #block path instead of tiling
+    stage = impairments.from_environ(os.environ)
+    if stage is None:
+        with iqstream.IqstreamWriter(filename) as w:
+            stimulus.write_tone(w, Tone13, Fs, num_samples,
+                                lambda x: (np.int16(x.real * gain), np.int16(x.imag * gain)))
+    else:
+        blocks = stage.apply_blocks(stimulus.tone_blocks(Tone13, Fs, num_samples))
+        stimulus.write_stimulus(filename, blocks, gain)
 
     print 'Output filename: ', filename
     print 'Number of samples: ', num_samples
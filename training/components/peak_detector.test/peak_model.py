@@ -0,0 +1,87 @@
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of OpenCPI <http://www.opencpi.org>
+#
+# OpenCPI is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# OpenCPI is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Peak Detector: Message-level model of the RCC worker's max_peak/min_peak.
+
+The RCC worker keeps a running maximum and minimum over both rails, starting
+from -32768/32767 in start(), and writes them to its properties once per
+message. trace() reproduces the property values after every message of a
+capture: the per-message extremes come from one np.maximum.reduceat()/
+np.minimum.reduceat() over the message offsets, and the running values from
+an accumulate() over those, chunk by chunk so a mapped capture is read once.
+
+A property read may happen at any message boundary, or before the first
+message while the properties still hold their initial value, so a sequence
+of reads from the log is checked with follows(): each read must appear in
+the trace, in order.
+
+The HDL worker is not modelled: it updates its peaks every sample and clears
+them whenever they are read, so its reads are not a running history.
+"""
+import numpy as np
+
+MESSAGE_SIZE = 8192    # bytes, messagesize in peak_detector-test.xml
+SAMPLE_SIZE  = 4       # one complex signed 16-bit sample per 32-bit word
+START_MAX    = -32768  # start(): max_buff
+START_MIN    = 32767   # start(): min_buff
+INITIAL      = 0       # property value until the first message is processed
+
+def trace(dout, message_samples=MESSAGE_SIZE // SAMPLE_SIZE, chunk_messages=512):
+    """Property values after each message of an iqstream capture.
+
+    Returns (max_trace, min_trace), int16 arrays with one entry per message
+    (the last message may be short). Entry k is what max_peak/min_peak hold
+    once message k has been processed.
+    """
+    num_messages = -(-len(dout) // message_samples)
+    max_trace = np.empty(num_messages, dtype=np.int16)
+    min_trace = np.empty(num_messages, dtype=np.int16)
+    running_max = np.int16(START_MAX)
+    running_min = np.int16(START_MIN)
+    chunk_size = message_samples * chunk_messages
+    for first in range(0, num_messages, chunk_messages):
+        chunk = dout[first*message_samples:first*message_samples+chunk_size]
+        offsets = np.arange(0, len(chunk), message_samples)
+        i, q = chunk['real_idx'], chunk['imag_idx']
+        highs = np.maximum(np.maximum.reduceat(i, offsets), np.maximum.reduceat(q, offsets))
+        lows = np.minimum(np.minimum.reduceat(i, offsets), np.minimum.reduceat(q, offsets))
+        highs[0] = max(highs[0], running_max)
+        lows[0] = min(lows[0], running_min)
+        np.maximum.accumulate(highs, out=max_trace[first:first+len(offsets)])
+        np.minimum.accumulate(lows, out=min_trace[first:first+len(offsets)])
+        running_max = max_trace[first+len(offsets)-1]
+        running_min = min_trace[first+len(offsets)-1]
+    return max_trace, min_trace
+
+def follows(reads, values, initial=INITIAL):
+    """Index into values of each read if reads occur in values in order, else None.
+
+    Reads before the first message may also hold initial; they are matched
+    at index -1.
+    """
+    values = np.concatenate(([initial], values))
+    matched = []
+    k = 0
+    for v in reads:
+        hits = np.flatnonzero(values[k:] == v)
+        if not len(hits):
+            return None
+        k += int(hits[0])
+        matched.append(k - 1)
+    return matched
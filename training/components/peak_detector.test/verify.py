@@ -33,11 +33,16 @@ calculations performed within the script.
 """
 import struct
 import shutil
-import numpy as np
 import sys
 import os.path
 import os
-import re
+
+# Shared iqstream helpers live in the project's scripts directory
+sys.path.append(os.path.join(os.environ.get('OCPI_PROJECT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')), 'scripts'))
+import iqstream
+import ocpilog
+import peak_model
 
 class color:
     PURPLE = '\033[95m'
@@ -62,37 +67,38 @@ def validation(argv):
 
     num_samples = int(argv[1])
 
-    # strip off output extension and replace with 'log' ('.out.out'=>'.log')
-    logname = os.path.splitext(argv[2])[0]
-    logname = os.path.splitext(logname)[0] + ".log"
-    if not os.path.isfile(logname):
-        logname = os.path.splitext(logname)[0] + ".remote_log"
+    # '.out.out' => '.log' (or '.remote_log')
+    logname = ocpilog.find_log(argv[2])
     # Parse the logfile for the final values of max/min peaks
     # Normally, we would access these via environment variables:
     #   OCPI_TEST_max_peak, OCPI_TEST_min_peak
     # Due to an inconsistency in the unit test framework, the final values of
     #   these properties are captured correctly in the environment variables
     #   for RCC workers, but not HDL.
-    with open(logname, 'rb') as log:
-        for line in log:
-            max_obj = re.search("Property \d+: peak_detector.max_peak = \"(-?\d+)\".*", line)
-            if max_obj: #max_obj[1]:
-                max_peak = int(max_obj.group(1))
-            min_obj = re.search("Property \d+: peak_detector.min_peak = \"(-?\d+)\".*", line)
-            if min_obj: #[1]:
-                min_peak = int(min_obj.group(1))
-
-    if not min_peak or not max_peak:
+    # Every read is kept: with verbose logging the properties are dumped more
+    #   than once, and the reads are checked against the per-message model.
+    props = ocpilog.properties(logname, 'peak_detector', history=True,
+                               cache_dir=os.environ.get('VERIFY_CACHE_DIR'))
+    max_reads = [int(v) for v in props.get('max_peak', [])]
+    min_reads = [int(v) for v in props.get('min_peak', [])]
+
+    if not min_reads or not max_reads:
         print("Exit: log file does not contain max/min peak final values")
         return
+    max_peak = max_reads[-1]
+    min_peak = min_reads[-1]
     #Read all of input data file as complex int16
     print 'File to validate: ', argv[2]
 
-    ofile = open(argv[2], 'rb')
-    dout = np.fromfile(ofile, dtype=np.dtype((np.uint32, {'real_idx':(np.int16,2), 'imag_idx':(np.int16,0)})), count=-1)
-    ofile.close()
+    dout = iqstream.read_iqstream(argv[2])
+    # Reduce both rails in one chunked pass over the mapped capture; the
+    # chunks can be spread over VERIFY_THREADS threads for long captures.
+    # The words are all zero exactly when both extremes are zero.
+    pymin, pymax = iqstream.peaks(dout,
+                                  chunk_size=int(os.environ.get('VERIFY_CHUNK_SIZE', 1<<20)),
+                                  threads=int(os.environ.get('VERIFY_THREADS', 1)))
     #Ensure dout is not all zeros
-    if all(dout == 0):
+    if pymin is None or pymin == pymax == 0:
         print color.RED + color.BOLD + 'FAILED, values are all zero' + color.END
         return
     #Ensure that dout is the expected amount of data
@@ -101,10 +107,6 @@ def validation(argv):
         print color.RED + color.BOLD + 'Length dout = ', len(dout), 'while expected length is = ' + color.END, num_samples
         return
 
-   # Calculate the maximum in python for verification
-    pymin = min(min(dout['real_idx']), min(dout['imag_idx']))
-    pymax = max(max(dout['real_idx']), max(dout['imag_idx']))
-
     print 'uut_min_peak = ', min_peak
     print 'uut_max_peak = ', max_peak
     print 'file_min_peak = ', pymin
@@ -114,6 +116,21 @@ def validation(argv):
         print color.RED + color.BOLD + 'FAILED, min/max values do not match' + color.END
         return
 
+    # The RCC worker writes its running min/max once per message, so every
+    # read must be their value at some message boundary (or the properties'
+    # initial value before the first message), in order. The HDL worker
+    # updates them every sample and clears them on each read, so only the
+    # final values above are checked for it.
+    if iqstream.worker_model(argv[2]) == 'rcc':
+        message_size = int(os.environ.get('VERIFY_MESSAGE_SIZE', peak_model.MESSAGE_SIZE))
+        max_trace, min_trace = peak_model.trace(dout, message_size // peak_model.SAMPLE_SIZE)
+        print 'messages = ', len(max_trace), '(', len(max_reads), 'max_peak reads,', len(min_reads), 'min_peak reads )'
+        for name, reads, values in (('max_peak', max_reads, max_trace),
+                                    ('min_peak', min_reads, min_trace)):
+            if peak_model.follows(reads, values) is None:
+                print color.RED + color.BOLD + 'FAILED, ' + name + ' reads', reads, 'do not follow the per-message trace' + color.END
+                return
+
     print 'Data matched expected results.'
     print color.GREEN + color.BOLD + 'PASSED' + color.END
     print '*** End validation ***\n'
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of OpenCPI <http://www.opencpi.org>
+#
+# OpenCPI is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# OpenCPI is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Generate the Mux_In message stream for Time Demux (messagesInFile).
+
+Generate args:
+- target file
+- optional golden Time_Out and Data_Out files (default: target file with
+  '_gold_time' and '_gold_data' appended)
+
+Properties (from the test framework):
+- OCPI_TEST_IFILE: any file, read as 32-bit words, one complex sample each
+- OCPI_TEST_START: the first "second" of the timestamps
+- OCPI_TEST_SAMPLES: samples per "second"
+
+Every second of samples is preceded by a Time message whose timestamp is
+(second << 32) | (second + 1), the samples follow as one Iq message, and a
+single zero-length Iq message ends the stream. The golden files hold what the
+worker should pass on: every timestamp, and every sample. With no options
+the output is byte-identical to test_data_generator.cxx.
+
+GENERATE_MESSAGES adds stress to the stream, as a comma separated list:
+  sizes:N or sizes:MIN:MAX  Iq messages of N (or uniformly MIN to MAX)
+                            samples; a second is split across as many as
+                            needed
+  zlm:P                     a zero-length Iq message before an Iq message
+                            with probability P
+  sync:P                    a Sync message before an Iq message with
+                            probability P
+  random:N                  N seeded random samples instead of IFILE
+  seed:N                    seed of the random choices (default 0)
+e.g. GENERATE_MESSAGES=sizes:1:600,sync:0.1,zlm:0.01,random:268435456.
+file_read may take a zero-length message as the end of its input, so zlm
+is meant for runs that drive the worker from other sources.
+
+The stream is built a chunk of seconds at a time: the message schedule comes
+from a few numpy operations on sample positions, and each chunk of headers,
+timestamps and samples is assembled in one word buffer and written with a
+single tofile() call.
+"""
+import sys
+import os.path
+import os
+import numpy as np
+
+# Shared message file helpers live in the project's scripts directory
+sys.path.append(os.path.join(os.environ.get('OCPI_PROJECT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')), 'scripts'))
+import messages
+
+WORD = 4                            # one complex sample per 32-bit word
+HEADER_WORDS = messages.HEADER.size // WORD
+TIME_WORDS = 2                      # uint64 timestamp
+
+class Options(object):
+    def __init__(self, sizes=None, zlm=0.0, sync=0.0, random=None, seed=0):
+        self.sizes = sizes
+        self.zlm = zlm
+        self.sync = sync
+        self.random = random
+        self.seed = seed
+
+def parse_options(text):
+    """Options from a GENERATE_MESSAGES list (see the module docstring)"""
+    opts = Options()
+    for item in text.split(','):
+        fields = item.strip().split(':')
+        kind, args = fields[0].lower(), fields[1:]
+        if not kind:
+            continue
+        if kind == 'sizes':
+            lo = int(args[0])
+            hi = int(args[1]) if len(args) > 1 else lo
+            if lo < 1 or hi < lo:
+                raise ValueError("Invalid Iq message sizes '%s'" % item)
+            opts.sizes = (lo, hi)
+        elif kind == 'zlm':
+            opts.zlm = float(args[0])
+        elif kind == 'sync':
+            opts.sync = float(args[0])
+        elif kind == 'random':
+            opts.random = int(args[0])
+        elif kind == 'seed':
+            opts.seed = int(args[0])
+        else:
+            raise ValueError("Unknown message option '%s'" % fields[0])
+    return opts
+
+def schedule(count, samples_per_second, opts, rng):
+    """Messages carrying count samples that start on a second boundary.
+
+    Returns (opcodes, sample_starts, sample_counts) in stream order; Time
+    messages have a sample count of 0 and start at their second.
+    """
+    seconds = np.arange(0, count, samples_per_second)
+    iq_starts = seconds
+    if opts.sizes is not None:
+        lo, hi = opts.sizes
+        cuts = np.cumsum(rng.randint(lo, hi+1, size=count//lo + 1))
+        iq_starts = np.union1d(seconds, cuts[cuts < count])
+    iq_counts = np.diff(np.append(iq_starts, count))
+    # sort key: position, then Time before Sync before zlm before Iq
+    pos = [seconds, iq_starts]
+    rank = [np.zeros(len(seconds), np.int8), np.full(len(iq_starts), 3, np.int8)]
+    ops = [np.full(len(seconds), messages.TIME), np.full(len(iq_starts), messages.IQ)]
+    for p, r, op in ((opts.sync, 1, messages.SYNC), (opts.zlm, 2, messages.IQ)):
+        if p:
+            at = iq_starts[rng.random_sample(len(iq_starts)) < p]
+            pos.append(at)
+            rank.append(np.full(len(at), r, np.int8))
+            ops.append(np.full(len(at), op))
+    counts = [np.zeros(len(seconds), np.int64), iq_counts]
+    counts += [np.zeros(len(a), np.int64) for a in pos[2:]]
+    pos, rank, ops, counts = [np.concatenate(a) for a in (pos, rank, ops, counts)]
+    order = np.lexsort((rank, pos))
+    return ops[order].astype(np.uint32), pos[order], counts[order]
+
+def assemble(samples, first_second, samples_per_second, opts, rng):
+    """Message stream words for a chunk of samples starting on a second"""
+    ops, starts, counts = schedule(len(samples), samples_per_second, opts, rng)
+    is_time = ops == messages.TIME
+    payload = np.where(is_time, TIME_WORDS, counts)
+    offsets = np.concatenate(([0], np.cumsum(HEADER_WORDS + payload)))
+    words = np.empty(offsets[-1], dtype=np.uint32)
+    head = offsets[:-1]
+    words[head] = payload * WORD
+    words[head+1] = ops
+    second = first_second + starts[is_time] // samples_per_second
+    words[head[is_time]+2] = (second + 1) & 0xffffffff
+    words[head[is_time]+3] = second
+    # everything that is not a header or a timestamp is Iq payload, in order
+    fill = np.ones(len(words), dtype=bool)
+    fill[head] = fill[head+1] = False
+    fill[head[is_time]+2] = fill[head[is_time]+3] = False
+    words[fill] = samples
+    stamps = ((second.astype(np.uint64) << np.uint64(32)) |
+              ((second + 1) & 0xffffffff).astype(np.uint64))
+    return words, stamps, len(ops)
+
+def generate(argv):
+    print "*** Generate input (messagesInFile stream) ***"
+    if len(argv) not in (2, 4):
+        print("Exit: Enter an output filename (and optionally golden time and data filenames)")
+        return
+    filename = argv[1]
+    gold_time = argv[2] if len(argv) == 4 else filename + '_gold_time'
+    gold_data = argv[3] if len(argv) == 4 else filename + '_gold_data'
+
+    start = int(os.environ['OCPI_TEST_START'])
+    if start < 0 or start > 0xffffffff:
+        raise ValueError("Invalid start_timestamp %d" % start)
+    samples_per_second = int(os.environ['OCPI_TEST_SAMPLES'])
+    if samples_per_second <= 0:
+        raise ValueError("Invalid samples_per_second %d" % samples_per_second)
+    opts = parse_options(os.environ.get('GENERATE_MESSAGES', ''))
+    rng = np.random.RandomState(opts.seed)
+
+    if opts.random is None:
+        ifile = os.environ['OCPI_TEST_IFILE']
+        num_samples = os.path.getsize(ifile) // WORD
+        source = (np.memmap(ifile, dtype=np.uint32, mode='r', shape=(num_samples,))
+                  if num_samples else np.zeros(0, dtype=np.uint32))
+    else:
+        ifile = 'random'
+        num_samples = opts.random
+        source = None
+    num_seconds = -(-num_samples // samples_per_second)
+    if start + num_seconds > 0xffffffff:
+        raise ValueError("Timestamps from %d overflow after %d seconds" % (start, num_seconds))
+
+    print 'Input File: ', ifile
+    print 'Start Time: ', start
+    print 'Samples per "second": ', samples_per_second
+    print 'Output Files: ', filename, gold_time, gold_data
+
+    chunk_seconds = max(1, (1 << 20) // samples_per_second)
+    chunk_size = chunk_seconds * samples_per_second
+    num_messages = 0
+    with open(filename, 'wb') as out, open(gold_time, 'wb') as tout, open(gold_data, 'wb') as dout:
+        for first in range(0, num_samples, chunk_size):
+            count = min(chunk_size, num_samples - first)
+            if source is None:
+                samples = rng.randint(0, 1 << 32, size=count, dtype=np.uint32)
+            else:
+                samples = source[first:first+count]
+            words, stamps, n = assemble(samples, start + first // samples_per_second,
+                                     samples_per_second, opts, rng)
+            words.tofile(out)
+            stamps.tofile(tout)
+            np.asarray(samples).tofile(dout)
+            num_messages += n
+        # a single zero-length Iq message ends the stream
+        np.array([0, messages.IQ], dtype=np.uint32).tofile(out)
+        num_messages += 1
+
+    print 'Number of samples: ', num_samples
+    print 'Number of messages: ', num_messages
+    print '*** End of file generation ***\n'
+
+def main():
+    print "\n","*"*80
+    print "*** Python: Time Demux ***"
+    generate(sys.argv)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of OpenCPI <http://www.opencpi.org>
+#
+# OpenCPI is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# OpenCPI is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Time Demux: Verify Data_Out and Time_Out
+
+Verify args:
+1. output data file used for validation (Data_Out or Time_Out)
+2. input message file (Mux_In, messagesInFile), next to its golden files
+
+generate.py writes every timestamp of the input to <input>_gold_time and
+every sample to <input>_gold_data. The worker passes Time messages to
+Time_Out and Iq samples to Data_Out, so each output must equal its golden
+file. The comparison runs chunk by chunk over the mapped files; on a mismatch
+the first differing item is traced back to the input message that carried it
+(message number, opcode, sequence number and byte offset), using the index
+of the input message file.
+
+The worker also counts what it reads: Messages_Read must be the number of
+input messages and Bytes_Read the payload bytes of its Iq and Time messages.
+"""
+import numpy as np
+import sys
+import os.path
+import os
+
+# Shared message file helpers live in the project's scripts directory
+sys.path.append(os.path.join(os.environ.get('OCPI_PROJECT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')), 'scripts'))
+import iqstream
+import messages
+import ocpilog
+
+class color:
+    PURPLE = '\033[95m'
+    CYAN = '\033[96m'
+    DARKCYAN = '\033[36m'
+    BLUE = '\033[94m'
+    GREEN = '\033[92m'
+    YELLOW = '\033[93m'
+    RED = '\033[91m'
+    BOLD = '\033[1m'
+    UNDERLINE = '\033[4m'
+    END = '\033[0m'
+
+def read_items(filename, dtype):
+    """Memory-map a file as an array of whole items"""
+    dtype = np.dtype(dtype)
+    count = os.path.getsize(filename) // dtype.itemsize
+    if not count:
+        # np.memmap refuses to map zero bytes
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode='r', shape=(count,))
+
+"""
+Ex: python verify.py {ofilename} {ifilename}
+Validate:
+TEST #1: Output matches its golden file item for item
+TEST #2: Output has the golden file's length
+TEST #3: Messages_Read and Bytes_Read count the input messages and payload
+"""
+
+if len(sys.argv) < 3:
+    print('Invalid arguments:  usage is: verify.py <output-file> <input-file>')
+    sys.exit(1)
+ofile, ifile = sys.argv[1], sys.argv[2]
+
+if 'Time_Out' in os.path.basename(ofile):
+    print 'Checking time:'
+    port, opcode, dtype, gold = 'Time_Out', messages.TIME, np.dtype('<u8'), ifile + '_gold_time'
+    kind = 'Time'
+elif 'Data_Out' in os.path.basename(ofile):
+    print 'Checking data:'
+    port, opcode, dtype, gold = 'Data_Out', messages.IQ, np.dtype(np.uint32), ifile + '_gold_data'
+    kind = 'Iq'
+else:
+    print color.RED + color.BOLD + 'FAILED, ' + ofile + ' is neither Time_Out nor Data_Out' + color.END
+    sys.exit(1)
+
+odata = read_items(ofile, dtype)
+gdata = read_items(gold, dtype)
+mfile = messages.MessageFile(ifile, cache_dir=os.environ.get('VERIFY_CACHE_DIR'))
+
+def where(item):
+    """Describe the input message that carried an output item"""
+    found = mfile.locate(opcode, item * dtype.itemsize)
+    if found is None:
+        return 'past the end of the input payloads'
+    k, seq, offset = found
+    return ('input message %d (opcode %d, %s message %d) at payload byte %d, file byte %d' %
+            (k, mfile.opcode(k), kind, seq, offset,
+             int(mfile.index['offset'][k]) + messages.HEADER.size + offset))
+
+chunk_size = int(os.environ.get('VERIFY_CHUNK_SIZE', 1<<20))
+compared, mismatched, first = iqstream.compare_words(odata, gdata, chunk_size)
+print port, 'items: ', len(odata), ' golden items: ', len(gdata)
+if first is not None:
+    print color.RED + color.BOLD + 'FAILED, %s differs from %s at item %d (byte %d)' % (
+        port, os.path.basename(gold), first, first * dtype.itemsize) + color.END
+    print '  expected 0x%0*x, got 0x%0*x' % (2*dtype.itemsize, int(gdata[first]),
+                                              2*dtype.itemsize, int(odata[first]))
+    print '  from', where(first)
+    print '  %d of the first %d items do not match' % (mismatched, compared)
+    sys.exit(1)
+if len(odata) != len(gdata):
+    print color.RED + color.BOLD + 'FAILED, %s has %d items, %s has %d' % (
+        port, len(odata), os.path.basename(gold), len(gdata)) + color.END
+    if len(odata) < len(gdata):
+        print '  the first missing item is from', where(len(odata))
+    sys.exit(1)
+
+# Final property values come from the environment (the worker is RCC only),
+# or from the log if the test framework did not set them
+messages_read = os.environ.get('OCPI_TEST_Messages_Read')
+bytes_read = os.environ.get('OCPI_TEST_Bytes_Read')
+logname = ocpilog.find_log(ofile)
+if (messages_read is None or bytes_read is None) and os.path.isfile(logname):
+    props = ocpilog.properties(logname, 'time_demux', cache_dir=os.environ.get('VERIFY_CACHE_DIR'))
+    messages_read = props.get('Messages_Read', messages_read)
+    bytes_read = props.get('Bytes_Read', bytes_read)
+expected_messages = len(mfile)
+expected_bytes = mfile.payload_bytes(messages.IQ) + mfile.payload_bytes(messages.TIME)
+if messages_read is None or bytes_read is None:
+    print color.YELLOW + 'Messages_Read/Bytes_Read not available, counters not checked' + color.END
+else:
+    print 'Messages_Read = ', messages_read, ' expected ', expected_messages
+    print 'Bytes_Read = ', bytes_read, ' expected ', expected_bytes
+    # the final zero-length message may be taken as the end of the input
+    # rather than delivered to the worker
+    allowed = [expected_messages]
+    if expected_messages and mfile.length(expected_messages-1) == 0:
+        allowed.append(expected_messages - 1)
+    if int(messages_read) not in allowed or int(bytes_read) != expected_bytes:
+        print color.RED + color.BOLD + 'FAILED, Messages_Read/Bytes_Read do not match the input' + color.END
+        sys.exit(1)
+
+print 'Data matched expected results.'
+print color.GREEN + color.BOLD + 'PASSED' + color.END
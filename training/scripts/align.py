@@ -0,0 +1,106 @@
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of OpenCPI <http://www.opencpi.org>
+#
+# OpenCPI is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# OpenCPI is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+align: Latency alignment of a worker's output capture against a reference.
+
+The RCC, HDL and 'advanced' variants of a worker delay their output by
+different numbers of samples (pipeline latency, a transient at the start of
+the output). Rather than hard-coding the delay per worker version, a verifier
+estimates it with estimate_latency() and compares out[lag:] with ref:
+
+    lag = align.estimate_latency(ref, out, max_lag=8)
+    ref, out = align.overlap(ref, out, lag)
+
+The estimate is the peak of the cross-correlation of the first 'prefix'
+samples, computed with FFTs in O(N log N). For a large search range the peak
+is first located on a decimated prefix and then refined at the full rate.
+
+Periodic stimulus (a tone) correlates equally well at every multiple of its
+period; the search range should be kept below one period, and among equal
+peaks the smallest |lag| wins since it overlaps the most samples.
+"""
+import numpy as np
+
+def as_signal(data):
+    """Complex128 copy of an iqstream array or any real/complex array"""
+    data = np.asarray(data)
+    if data.dtype.names is not None:
+        out = np.empty(len(data), dtype=np.complex128)
+        out.real = data['real_idx']
+        out.imag = data['imag_idx']
+        return out
+    return data.astype(np.complex128)
+
+def correlate(ref, out, min_lag, max_lag):
+    """Re(sum(out[n+lag]*conj(ref[n]))) for lag in [min_lag, max_lag].
+
+    ref and out are complex arrays; the result is indexed by lag - min_lag.
+    The real part is used rather than the magnitude: a complex tone delayed
+    by any lag has the same |correlation|, but only the true delay lines the
+    phases up.
+    """
+    n = 1
+    while n < len(ref) + len(out):
+        n <<= 1
+    c = np.fft.ifft(np.fft.fft(out, n) * np.conj(np.fft.fft(ref, n)))
+    # negative lags wrap to the end of the circular correlation
+    return c[np.arange(min_lag, max_lag+1) % n].real
+
+def direct_correlate(ref, out, lags):
+    """Same as correlate() for a short list of lags, without FFTs"""
+    result = np.zeros(len(lags))
+    for k, lag in enumerate(lags):
+        r, o = overlap(ref, out, lag)
+        result[k] = np.vdot(r, o).real
+    return result
+
+def estimate_latency(ref, out, max_lag=64, min_lag=None, prefix=1<<16, decimate=1):
+    """Integer latency of out relative to ref (out[n+lag] ~ ref[n]).
+
+    ref/out may be iqstream arrays or real/complex arrays; only their first
+    prefix samples are read. lag is searched in [min_lag, max_lag] (min_lag
+    defaults to -max_lag). With decimate > 1 the correlation is first taken
+    on every decimate-th sample and the coarse peak refined at the full rate.
+    """
+    if min_lag is None:
+        min_lag = -max_lag
+    ref = as_signal(ref[0:prefix])
+    out = as_signal(out[0:prefix])
+    if decimate > 1:
+        c = correlate(ref[::decimate], out[::decimate],
+                      -(-min_lag // decimate), max_lag // decimate)
+        coarse = (-(-min_lag // decimate) + int(np.argmax(c))) * decimate
+        lags = np.arange(max(coarse - decimate + 1, min_lag),
+                         min(coarse + decimate, max_lag + 1))
+        c = direct_correlate(ref, out, lags)
+    else:
+        lags = np.arange(min_lag, max_lag + 1)
+        c = correlate(ref, out, min_lag, max_lag)
+    # argmax keeps the first of equal peaks, so visit lags by increasing |lag|
+    order = np.argsort(np.abs(lags), kind='mergesort')
+    return int(lags[order[np.argmax(c[order])]])
+
+def overlap(ref, out, lag):
+    """Views of ref and out lined up for a latency of lag samples"""
+    if lag >= 0:
+        out = out[lag:]
+    else:
+        ref = ref[-lag:]
+    length = min(len(ref), len(out))
+    return ref[0:length], out[0:length]
@@ -0,0 +1,115 @@
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of OpenCPI <http://www.opencpi.org>
+#
+# OpenCPI is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# OpenCPI is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+impairments: Receiver impairments added to generated stimulus.
+
+An Impairments stage sits between synthesis and quantization in a generator:
+
+    stage = impairments.from_environ(os.environ)
+    if stage is not None:
+        blocks = stage.apply_blocks(blocks)
+
+It works on complex blocks whose full scale is 1.0 and applies, in order:
+  iq:GAIN:DEGREES   IQ imbalance, Q' = GAIN*(Q*cos(p) + I*sin(p))
+  phase:RMS         random-walk phase noise, RMS radians per sample
+  dc:I[:Q]          DC offset
+  awgn:RMS          complex white Gaussian noise, RMS over both rails
+  clip:LEVEL        each rail limited to +/-LEVEL
+  seed:N            seed of the random impairments (default 0)
+
+GENERATE_IMPAIRMENTS holds the comma separated list for every generator,
+e.g. GENERATE_IMPAIRMENTS=awgn:0.01,dc:0.005,iq:1.02:1.5,clip:0.8,seed:3.
+Each random impairment draws from its own seeded generator in sample order,
+so a given seed always gives the same output, and the same random draws
+whatever the block size.
+"""
+import numpy as np
+
+class Impairments(object):
+    def __init__(self, awgn=0.0, dc=0j, iq_gain=1.0, iq_phase=0.0, phase_noise=0.0,
+                 clip=None, seed=0):
+        self.awgn = float(awgn)
+        self.dc = complex(dc)
+        self.iq_gain = float(iq_gain)
+        self.iq_phase = np.radians(float(iq_phase))
+        self.phase_noise = float(phase_noise)
+        self.clip = clip
+        self.seed = int(seed)
+        self.reset()
+
+    def reset(self):
+        """Restart the random sequences and the phase noise walk"""
+        self.awgn_rng = np.random.RandomState(self.seed)
+        self.phase_rng = np.random.RandomState(self.seed + 1)
+        self.phase = 0.0
+
+    def apply(self, x):
+        """Impaired copy of a complex block; blocks must be passed in order"""
+        y = np.array(x, dtype=np.complex128)
+        if self.iq_gain != 1.0 or self.iq_phase:
+            y.imag = self.iq_gain*(y.imag*np.cos(self.iq_phase) + y.real*np.sin(self.iq_phase))
+        if self.phase_noise and len(y):
+            walk = self.phase + np.cumsum(self.phase_rng.standard_normal(len(y))*self.phase_noise)
+            self.phase = walk[-1]
+            y *= np.exp(1j*walk)
+        y += self.dc
+        if self.awgn:
+            v = self.awgn_rng.standard_normal((len(y), 2)) * (self.awgn/np.sqrt(2))
+            y.real += v[:, 0]
+            y.imag += v[:, 1]
+        if self.clip is not None:
+            y.real = np.clip(y.real, -self.clip, self.clip)
+            y.imag = np.clip(y.imag, -self.clip, self.clip)
+        return y
+
+    def apply_blocks(self, blocks):
+        """Generator stage: impair each block of an iterable in turn"""
+        self.reset()
+        for x in blocks:
+            yield self.apply(x)
+
+def parse(text):
+    """Impairments from a comma separated list (see the module docstring),
+    or None when the list is empty"""
+    kwargs = {}
+    for item in text.split(','):
+        fields = item.strip().split(':')
+        kind, args = fields[0].lower(), [float(v) for v in fields[1:]]
+        if not kind:
+            continue
+        if kind == 'awgn':
+            kwargs['awgn'] = args[0]
+        elif kind == 'dc':
+            kwargs['dc'] = complex(args[0], args[1] if len(args) > 1 else args[0])
+        elif kind == 'iq':
+            kwargs['iq_gain'] = args[0]
+            kwargs['iq_phase'] = args[1] if len(args) > 1 else 0.0
+        elif kind == 'phase':
+            kwargs['phase_noise'] = args[0]
+        elif kind == 'clip':
+            kwargs['clip'] = args[0]
+        elif kind == 'seed':
+            kwargs['seed'] = int(args[0])
+        else:
+            raise ValueError("Unknown impairment '%s'" % fields[0])
+    return Impairments(**kwargs) if kwargs else None
+
+def from_environ(environ):
+    """Impairments requested by GENERATE_IMPAIRMENTS, or None"""
+    return parse(environ.get('GENERATE_IMPAIRMENTS', ''))
@@ -0,0 +1,227 @@
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of OpenCPI <http://www.opencpi.org>
+#
+# OpenCPI is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# OpenCPI is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+iqstream: Shared access to iqstream capture files (binary data files).
+
+An iqstream capture is a flat sequence of 32-bit words, one complex signed
+16-bit sample per word. The test scripts address I at bytes 2-3 and Q at
+bytes 0-1 of each word; plotAndFft.py historically uses the opposite layout,
+which is selected with swap_iq=True.
+
+Captures are memory-mapped rather than read with np.fromfile, so the
+'real_idx'/'imag_idx' fields are zero-copy views into the page cache and a
+multi-GB output file from a long run is never held in RAM. A complex array is
+only built when a caller asks for one with to_complex().
+
+compare_words() checks two captures for equality chunk by chunk and stops at
+the first chunk that differs. peaks() reduces both rails to their minimum and
+maximum the same way, optionally spreading the chunks over a thread pool.
+
+Captures are written through IqstreamWriter, which packs I/Q rails into a
+reusable block buffer and writes each block with a single tofile() call
+instead of one f.write() per sample.
+
+Scripts outside of this directory import it with:
+    sys.path.append(os.path.join(os.environ.get('OCPI_PROJECT_DIR', ...), 'scripts'))
+"""
+import hashlib
+import os
+from multiprocessing.pool import ThreadPool
+import numpy as np
+
+# I/Q pair in a 32-bit word, as written by the generate.py scripts
+dt_iq_pair = np.dtype((np.uint32, {'real_idx':(np.int16,2), 'imag_idx':(np.int16,0)}))
+# I/Q pair in a 32-bit word with I at byte 0 (plotAndFft.py)
+dt_iq_pair_swapped = np.dtype((np.uint32, {'real_idx':(np.int16,0), 'imag_idx':(np.int16,2)}))
+
+def iq_dtype(swap_iq=False):
+    return dt_iq_pair_swapped if swap_iq else dt_iq_pair
+
+def read_iqstream(filename, count=-1, offset=0, swap_iq=False, mode='r'):
+    """Memory-map an iqstream capture.
+
+    Returns an array of dt_iq_pair words starting at sample 'offset' and
+    holding at most 'count' samples (-1 for the rest of the file). Comparisons
+    against the array operate on the raw 32-bit words, so 'data == 0' and
+    'idata != odata' behave exactly as they did with np.fromfile.
+    """
+    dt = iq_dtype(swap_iq)
+    available = file_samples(filename) - offset
+    if count < 0 or count > available:
+        count = available
+    if count <= 0:
+        # np.memmap refuses to map zero bytes
+        return np.zeros(0, dtype=dt)
+    return np.memmap(filename, dtype=dt, mode=mode, offset=offset*dt.itemsize,
+                     shape=(count,))
+
+def file_samples(filename):
+    """Number of whole complex samples in an iqstream capture"""
+    with open(filename, 'rb') as f:
+        f.seek(0, 2)
+        return f.tell() // dt_iq_pair.itemsize
+
+def file_digest(filename, block_size=1<<20):
+    """SHA-1 hex digest of a file, read in blocks"""
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+def worker_model(output_file):
+    """Authoring model ('hdl', 'rcc', ...) of the worker that produced an
+    output file ('case00.00.complex_mixer.hdl.out.out' => 'hdl'), or None
+    when the name does not follow the test framework's convention"""
+    fields = os.path.basename(output_file).split('.')
+    for model in ('hdl', 'rcc', 'ocl'):
+        if model in fields[2:-1]:
+            return model
+    return None
+
+def compare_words(a, b, chunk_size=1<<20, early_exit=True):
+    """Compare two iqstream arrays word for word, one chunk at a time.
+
+    Only a chunk_size boolean array exists at any time, so multi-GB mapped
+    captures can be compared. With early_exit the comparison stops after the
+    first chunk that differs. Returns (compared, mismatched, first) where
+    first is the index of the first differing word (None if all match) and
+    compared/mismatched count the words in the chunks that were checked.
+    """
+    length = min(len(a), len(b))
+    compared = 0
+    mismatched = 0
+    first = None
+    for start in range(0, length, chunk_size):
+        end = min(start + chunk_size, length)
+        diff = a[start:end] != b[start:end]
+        compared += len(diff)
+        n = np.count_nonzero(diff)
+        if n:
+            if first is None:
+                first = start + int(np.argmax(diff))
+            mismatched += n
+            if early_exit:
+                break
+    return compared, mismatched, first
+
+def chunk_peaks(data):
+    """(min, max) over both rails of one iqstream chunk"""
+    i, q = data['real_idx'], data['imag_idx']
+    return min(i.min(), q.min()), max(i.max(), q.max())
+
+def peaks(data, chunk_size=1<<20, threads=1):
+    """Minimum and maximum value over both rails of an iqstream array.
+
+    The array is reduced one chunk at a time, so a mapped capture is read
+    once and never held in RAM. NumPy releases the GIL inside the
+    reductions, so with threads > 1 the chunks are reduced in parallel.
+    Returns (min, max) as ints, or (None, None) for an empty array.
+    """
+    if not len(data):
+        return None, None
+    chunks = (data[start:start+chunk_size] for start in range(0, len(data), chunk_size))
+    if threads > 1:
+        pool = ThreadPool(threads)
+        try:
+            results = pool.imap_unordered(chunk_peaks, chunks)
+            lows, highs = zip(*results)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        lows, highs = zip(*[chunk_peaks(c) for c in chunks])
+    return int(min(lows)), int(max(highs))
+
+def rails(data):
+    """Return (I, Q) int16 views of an iqstream array without copying"""
+    return data['real_idx'], data['imag_idx']
+
+def to_complex(data, dtype=np.complex64):
+    """Build a complex array from an iqstream array (this is the only copy)"""
+    out = np.empty(len(data), dtype=dtype)
+    out.real = data['real_idx']
+    out.imag = data['imag_idx']
+    return out
+
+def iter_blocks(data, block_size):
+    """Yield (start, block) over an iqstream array in block_size pieces"""
+    for start in range(0, len(data), block_size):
+        yield start, data[start:start+block_size]
+
+class IqstreamWriter(object):
+    """Buffered iqstream writer.
+
+    Usage:
+        with IqstreamWriter(filename) as w:
+            w.write(real, imag)   # any number of times, any lengths
+
+    real/imag are converted to int16 as they are packed (the same C cast that
+    np.int16() applies), so callers round or truncate exactly as before.
+    """
+    def __init__(self, filename, block_size=1<<16, swap_iq=False):
+        self.filename = filename
+        self.f = open(filename, 'wb')
+        self.buf = np.zeros(block_size, dtype=iq_dtype(swap_iq))
+        self.num_samples = 0
+
+    def pack(self, real, imag):
+        """Pack I/Q rails into a new array of this writer's word layout"""
+        words = np.zeros(len(real), dtype=self.buf.dtype)
+        words['real_idx'] = real
+        words['imag_idx'] = imag
+        return words
+
+    def write(self, real, imag):
+        real = np.asarray(real)
+        imag = np.asarray(imag)
+        if real.shape != imag.shape:
+            raise ValueError("I and Q rails differ in length: %d vs %d" % (real.size, imag.size))
+        block_size = len(self.buf)
+        for start in range(0, len(real), block_size):
+            end = min(start + block_size, len(real))
+            block = self.buf[0:end-start]
+            block['real_idx'] = real[start:end]
+            block['imag_idx'] = imag[start:end]
+            block.tofile(self.f)
+        self.num_samples += len(real)
+
+    def write_words(self, data):
+        """Write an already packed iqstream array (e.g. a repeated tile)"""
+        np.asarray(data).tofile(self.f)
+        self.num_samples += len(data)
+
+    def close(self):
+        if not self.f.closed:
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def write_iqstream(filename, real, imag, swap_iq=False):
+    """Write complete I/Q rails to an iqstream capture"""
+    with IqstreamWriter(filename, swap_iq=swap_iq) as w:
+        w.write(real, imag)
+    return w.num_samples
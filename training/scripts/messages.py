@@ -0,0 +1,236 @@
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of OpenCPI <http://www.opencpi.org>
+#
+# OpenCPI is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# OpenCPI is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+messages: Access to messagesInFile='true' capture files.
+
+With messagesInFile the file_read/file_write workers store every message as
+an 8-byte header, a little-endian uint32 payload length in bytes and a uint32
+opcode, followed by the payload:
+
+    length | opcode | payload (length bytes) | length | opcode | ...
+
+MessageFile memory-maps such a file and indexes it once: the header offset,
+length and opcode of every message, kept as numpy arrays. Given a cache
+directory (the verify scripts pass VERIFY_CACHE_DIR), the index is saved
+there in a sidecar file keyed on the capture's path, size and mtime, so
+reopening a multi-GB capture costs no scan at all. Message k is then one
+array lookup away, and payloads are zero-copy views into the mapped file:
+
+    f = messages.MessageFile('Mux_In.in')
+    for k in f.select(messages.TIME):
+        print f.payload(k, '<u8')[0]
+    iq = f.view(messages.IQ, np.uint32)   # one row per Iq message
+    k, seq, offset = f.locate(messages.IQ, 4096)   # message with Iq byte 4096
+
+The headers form a chain (each one's offset depends on every previous
+length), so scan_headers() walks it; but as soon as the last few messages
+repeat a pattern (e.g. Time, Iq, Time, Iq, ...) it checks a whole batch of
+further repetitions with numpy at once and only steps message by message
+where the pattern breaks.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import numpy as np
+
+# Opcodes of iqstream_with_sync_protocol
+IQ   = 0
+SYNC = 1
+TIME = 2
+
+HEADER = struct.Struct('<II')
+dt_index = np.dtype([('offset', '<u8'), ('length', '<u4'), ('opcode', '<u4')])
+
+def header_words(data, pos):
+    """Little-endian uint32 at each (possibly unaligned) byte offset in pos"""
+    b = data[pos[..., np.newaxis] + np.arange(4)].astype(np.uint32)
+    return b[..., 0] | (b[..., 1] << 8) | (b[..., 2] << 16) | (b[..., 3] << 24)
+
+def scan_headers(data, max_period=4, batch=1<<16):
+    """Index (dt_index array) of the messages in a uint8 array of a capture.
+
+    Raises ValueError if the last message is cut short.
+    """
+    size = len(data)
+    pieces = []
+    steps = []   # (offset, length, opcode) found one at a time
+    recent = []  # the last 2*max_period (length, opcode) pairs
+    p = 0
+    while p < size:
+        if p + HEADER.size > size:
+            raise ValueError("Truncated message header at byte %d" % p)
+        length, opcode = HEADER.unpack_from(data, p)
+        if p + HEADER.size + length > size:
+            raise ValueError("Message at byte %d needs %d payload bytes, %d left" %
+                             (p, length, size - p - HEADER.size))
+        steps.append((p, length, opcode))
+        p += HEADER.size + length
+        recent.append((length, opcode))
+        del recent[:-2*max_period]
+        for period in range(1, max_period+1):
+            if len(recent) < 2*period or recent[-period:] != recent[-2*period:-period]:
+                continue
+            pattern = np.array(recent[-period:], dtype=np.int64)
+            rel = np.concatenate(([0], np.cumsum(pattern[:, 0] + HEADER.size)))
+            stride, rel = int(rel[-1]), rel[:-1]
+            found = 0
+            while True:
+                count = min(batch, (size - p) // stride)
+                if count <= 0:
+                    break
+                pos = p + np.arange(count, dtype=np.int64)[:, np.newaxis]*stride + rel
+                ok = ((header_words(data, pos) == pattern[:, 0]) &
+                      (header_words(data, pos + 4) == pattern[:, 1])).all(axis=1)
+                n = count if ok.all() else int(np.argmin(ok))
+                if n:
+                    if steps:
+                        pieces.append(np.array(steps, dtype=dt_index))
+                        steps = []
+                    run = np.empty(n*period, dtype=dt_index)
+                    run['offset'] = pos[0:n].ravel()
+                    run['length'] = np.tile(pattern[:, 0], n)
+                    run['opcode'] = np.tile(pattern[:, 1], n)
+                    pieces.append(run)
+                    p += n*stride
+                    found += n
+                if n < count:
+                    break
+            if found:
+                break
+    if steps or not pieces:
+        pieces.append(np.array(steps, dtype=dt_index))
+    return np.concatenate(pieces)
+
+def index_path(filename, cache_dir=None):
+    """Sidecar index file of a capture, keyed on its path, size and mtime.
+    Caching is opt-in: without a cache_dir this returns None."""
+    if cache_dir is None:
+        return None
+    st = os.stat(filename)
+    # captures of different runs share a basename, so the path is in the key
+    path = hashlib.sha1(os.path.abspath(filename)).hexdigest()[:12]
+    return os.path.join(cache_dir, '.%s.%s.%d-%d.msgidx.npy' %
+                        (os.path.basename(filename), path, st.st_size, int(st.st_mtime*1e6)))
+
+class MessageFile(object):
+    """A memory-mapped messagesInFile capture and its message index"""
+    def __init__(self, filename, cache_dir=None):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.data = np.frombuffer(self.map, dtype=np.uint8)
+            else:
+                # mmap refuses to map an empty file
+                self.map = None
+                self.data = np.zeros(0, dtype=np.uint8)
+        self.index = self.load_index(cache_dir)
+
+    def load_index(self, cache_dir=None):
+        """Map the sidecar index, or scan the capture and write one (just
+        scan it without a cache_dir)"""
+        index_file = index_path(self.filename, cache_dir)
+        if index_file is None:
+            return scan_headers(self.data)
+        if os.path.isfile(index_file):
+            return np.load(index_file, mmap_mode='r')
+        index = scan_headers(self.data)
+        tmp_file = '%s.%d.tmp' % (index_file, os.getpid())
+        try:
+            with open(tmp_file, 'wb') as f:
+                np.save(f, index)
+            os.rename(tmp_file, index_file)
+        except (IOError, OSError):
+            # an unwritable directory only costs a rescan next time
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+        return index
+
+    def __len__(self):
+        return len(self.index)
+
+    def opcode(self, k):
+        return int(self.index['opcode'][k])
+
+    def length(self, k):
+        return int(self.index['length'][k])
+
+    def payload(self, k, dtype=np.uint8):
+        """Zero-copy view of message k's payload"""
+        start = int(self.index['offset'][k]) + HEADER.size
+        return self.data[start:start+int(self.index['length'][k])].view(dtype)
+
+    def __getitem__(self, k):
+        """(opcode, payload bytes) of message k"""
+        return self.opcode(k), self.payload(k)
+
+    def select(self, opcode):
+        """Indices of the messages with an opcode, in file order"""
+        return np.flatnonzero(self.index['opcode'] == opcode)
+
+    def iter_payloads(self, opcode, dtype=np.uint8):
+        """Yield (k, payload view) for each message with an opcode"""
+        for k in self.select(opcode):
+            yield k, self.payload(k, dtype)
+
+    def view(self, opcode, dtype=np.uint8):
+        """Zero-copy 2-D view of all payloads of an opcode, one message per row.
+
+        Only possible when those messages all have the same length and are
+        evenly spaced in the file (a regular stream); otherwise ValueError is
+        raised and iter_payloads() should be used.
+        """
+        sel = self.index[self.select(opcode)]
+        dtype = np.dtype(dtype)
+        if not len(sel):
+            return np.zeros((0, 0), dtype=dtype)
+        length = int(sel['length'][0])
+        offsets = sel['offset'].astype(np.int64)
+        spacing = np.diff(offsets)
+        if (sel['length'] != length).any() or (len(spacing) and (spacing != spacing[0]).any()):
+            raise ValueError("Opcode %d messages are not evenly sized and spaced" % opcode)
+        if length % dtype.itemsize:
+            raise ValueError("Opcode %d payloads of %d bytes do not hold whole %s items" %
+                             (opcode, length, dtype))
+        stride = int(spacing[0]) if len(spacing) else length + HEADER.size
+        view = np.ndarray(shape=(len(sel), length // dtype.itemsize), dtype=dtype,
+                          buffer=self.data, offset=int(offsets[0]) + HEADER.size,
+                          strides=(stride, dtype.itemsize))
+        view.flags.writeable = False
+        return view
+
+    def locate(self, opcode, byte_offset):
+        """Message holding a byte of the concatenated payloads of an opcode.
+
+        Returns (k, seq, offset): the message index in the file, its sequence
+        number among the messages with that opcode and the byte offset within
+        its payload; None when byte_offset is past the last payload.
+        """
+        sel = self.select(opcode)
+        ends = np.cumsum(self.index['length'][sel], dtype=np.uint64)
+        seq = int(np.searchsorted(ends, byte_offset, side='right'))
+        if seq >= len(sel):
+            return None
+        start = int(ends[seq]) - int(self.index['length'][sel[seq]])
+        return int(sel[seq]), seq, byte_offset - start
+
+    def payload_bytes(self, opcode):
+        """Total payload bytes of the messages with an opcode"""
+        return int(self.index['length'][self.index['opcode'] == opcode].sum(dtype=np.uint64))
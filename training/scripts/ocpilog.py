@@ -0,0 +1,113 @@
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of OpenCPI <http://www.opencpi.org>
+#
+# OpenCPI is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# OpenCPI is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+ocpilog: Property values from the logs of unit test runs.
+
+The test framework logs every property dump of a run (.log, or .remote_log
+for remote runs) as lines of the form
+
+    Property 3: peak_detector.max_peak = "31129"
+
+Final property values are normally passed to verify scripts as OCPI_TEST_*
+environment variables, but for HDL workers these do not hold the values at
+the end of the run, so verify scripts read them from the log instead:
+
+    props = ocpilog.properties(ocpilog.find_log(argv[2]), 'peak_detector')
+    max_peak = int(props['max_peak'])
+
+The log is memory-mapped and scanned once with a single compiled expression
+for every property of every worker. Given a cache directory (the verify
+scripts pass VERIFY_CACHE_DIR), the parsed values are cached there in a JSON
+file keyed on the log's path, mtime and size, so verifying several outputs
+of the same run parses its log only once.
+"""
+import json
+import mmap
+import os
+import re
+
+PROPERTY_RE = re.compile(r'Property\s+\d+:\s+(\S+)\.(\w+)\s+=\s+"([^"\n]*)"')
+
+def find_log(output_file):
+    """Log of the run that produced an output file ('.out.out' => '.log'),
+    or its '.remote_log' when there is no local log"""
+    logname = os.path.splitext(os.path.splitext(output_file)[0])[0] + '.log'
+    if not os.path.isfile(logname):
+        logname = os.path.splitext(logname)[0] + '.remote_log'
+    return logname
+
+def scan(logname):
+    """Every property read in a log, as {worker: {property: [values in order]}}"""
+    history = {}
+    with open(logname, 'rb') as log:
+        if os.fstat(log.fileno()).st_size == 0:
+            # mmap refuses to map an empty file
+            return history
+        text = mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for worker, prop, value in PROPERTY_RE.findall(text):
+                history.setdefault(worker, {}).setdefault(prop, []).append(value)
+        finally:
+            text.close()
+    return history
+
+def cache_path(logname, cache_dir=None):
+    """Cache file of a log's parsed properties. Caching is opt-in: without a
+    cache_dir this returns None."""
+    if cache_dir is None:
+        return None
+    return os.path.join(cache_dir, '.' + os.path.basename(logname) + '.properties.json')
+
+def cached_scan(logname, cache_dir=None):
+    """scan() that reuses the cached result while the log is unchanged"""
+    cache_file = cache_path(logname, cache_dir)
+    if cache_file is None:
+        return scan(logname)
+    st = os.stat(logname)
+    # logs of different runs share a basename, so the path is part of the key
+    key = [os.path.abspath(logname), st.st_mtime, st.st_size]
+    try:
+        with open(cache_file, 'r') as f:
+            cached = json.load(f)
+        if cached['key'] == key:
+            return cached['history']
+    except (IOError, OSError, ValueError, KeyError):
+        pass
+    history = scan(logname)
+    tmp_file = '%s.%d.tmp' % (cache_file, os.getpid())
+    try:
+        with open(tmp_file, 'w') as f:
+            json.dump({'key': key, 'history': history}, f)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError):
+        # an unwritable directory only costs a rescan next time
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return history
+
+def properties(logname, worker, history=False, cache_dir=None):
+    """Property values of one worker in a log.
+
+    Returns {property: final value}, or with history=True {property: [every
+    value read, in order]}. Values are the strings as logged.
+    """
+    props = cached_scan(logname, cache_dir).get(worker, {})
+    if history:
+        return props
+    return dict((prop, values[-1]) for prop, values in props.items())
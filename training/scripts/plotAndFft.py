@@ -27,6 +27,8 @@ except (ImportError, RuntimeError):
 import sys
 import os.path
 import itertools
+import iqstream
+import spectrum
 
 def main():
     dataType = "real"
@@ -43,6 +45,7 @@ def main():
     elif len(sys.argv) < 5:
         print("Exit: Enter sample rate of input")
         sys.exit(1)
+    # Optional 5th argument: FFT size of the averaged (Welch) spectrum
     elif len(sys.argv) > 6:
         print("Exit: Wrong number of arguments")
         sys.exit(1)
@@ -52,6 +55,7 @@ def main():
     dataType = sys.argv[2].lower()
     numSamples = int(sys.argv[3])
     sampleRate = float(sys.argv[4])
+    fftSize = int(sys.argv[5]) if len(sys.argv) > 5 else 4096
     print "file is : " + f.name
     print "data is : " + dataType
     print "num samples is: " + str(numSamples)
@@ -61,17 +65,10 @@ def main():
         print "Input is complex data"
         #I/Q pair in a 32-bit vector (31:0) is I(0) I(1) Q(0) Q(1) in bytes 0123 little-Endian
         #Thus I is indexed at byte 0 and Q is indexed at byte 2
-        dt_iq_pair = np.dtype((np.uint32, {'real_idx':(np.int16,0), 'imag_idx':(np.int16,2)}))
-        data = np.fromfile(f, dtype=dt_iq_pair)
+        data = iqstream.read_iqstream(f.name, swap_iq=True)
 
-        #Pull out I and Q and make lists for each
-        iList = data['real_idx']
-        qList = data['imag_idx']
-        iqList = []
-        iqList_mag = []
-
-        for a,data in enumerate(iList):
-            iqList.append(complex(int(iList[int(a)]),int(qList[int(a)])))
+        #Pull out I and Q views; the spectrum converts one block at a time
+        iList, qList = iqstream.rails(data)
 
         #Create time domain plot
         fig = plt.figure(1)
@@ -89,26 +86,18 @@ def main():
         leg1 = ax1.legend()
         leg2 = ax2.legend()
 
-        # sample spacing
-        T = 1.0 / sampleRate
-
-        #Generate FFT bins
-        xf = np.fft.fftfreq(numSamples, T)
-        xf = np.fft.fftshift(xf)
-
-        #Perform FFT
-        yf = np.fft.fft(iqList[0:numSamples])
-        yplot = np.fft.fftshift(yf)
-        yf_plot=1.0/numSamples * np.abs(yplot)
+        #Averaged (Welch) spectrum of fftSize-point segments, streamed from the file
+        psd = spectrum.welch(data[0:numSamples], fftSize, sampleRate)
+        xf, yf_plot = psd.shifted()
 
         #Create FFT plot
         fft_fig = plt.figure(2)
         ax3 = fft_fig.add_subplot(1, 1, 1)
         epsilon = pow(10, -10) #Error factor to avoid divide by zero in log10
-        ax3.plot(xf,20*np.log10(yf_plot+epsilon))
+        ax3.plot(xf,10*np.log10(yf_plot+epsilon))
 
         #Beautify plot
-        ax3.set_title(str(numSamples) + '-Point Complex FFT\n' + os.path.basename(f.name))
+        ax3.set_title(str(psd.nfft) + '-Point Complex FFT, ' + str(psd.segments) + ' averages\n' + os.path.basename(f.name))
         ax3.set_xlabel('Frequency (Hz)')
         ax3.set_ylabel('Power (dBm)')
         #ax3.set_ylim([-50, 150])
@@ -120,7 +109,10 @@ def main():
         print("End!")
     else:
         print "Input is real data"
-        data = np.fromfile(f, dtype=np.int16)
+        #np.memmap refuses to map an empty file
+        count = os.path.getsize(f.name) // 2
+        data = (np.memmap(f.name, dtype=np.int16, mode='r', shape=(count,)) if count
+                else np.zeros(0, dtype=np.int16))
         #Create time domain plot
         fig = plt.figure(1)
         ax1 = fig.add_subplot(1, 1, 1)
@@ -132,27 +124,18 @@ def main():
         ax1.set_ylabel('Amplitude')
         leg1 = ax1.legend()
 
-        # sample spacing
-        T = 1.0 / sampleRate
-        x = np.linspace(0.0, numSamples*T, numSamples)
-
-        #Generate FFT bins
-        xf = np.fft.fftfreq(numSamples, T)
-        xf = np.fft.fftshift(xf)
-
-        #Perform FFT
-        yf = np.fft.fft(data[0:numSamples])
-        yplot = np.fft.fftshift(yf)
-        yf_plot=1.0/numSamples * np.abs(yplot)
+        #Averaged (Welch) spectrum of fftSize-point segments
+        psd = spectrum.welch(data[0:numSamples], fftSize, sampleRate)
+        xf, yf_plot = psd.shifted()
 
         #Create FFT plot
         fft_fig = plt.figure(2)
         ax2 = fft_fig.add_subplot(1, 1, 1)
         epsilon = pow(10, -10) #Error factor to avoid divide by zero in log10
-        ax2.plot(xf[xf.size/2:xf.size],20*np.log10(yf_plot[yf.size/2:yf.size]+epsilon))
+        ax2.plot(xf[xf.size/2:xf.size],10*np.log10(yf_plot[xf.size/2:xf.size]+epsilon))
 
         #Beautify plot
-        ax2.set_title(str(numSamples) + '-Point Real FFT\n' + os.path.basename(f.name))
+        ax2.set_title(str(psd.nfft) + '-Point Real FFT, ' + str(psd.segments) + ' averages\n' + os.path.basename(f.name))
         ax2.set_xlabel('Frequency (Hz)')
         ax2.set_ylabel('Power (dBm)')
         #ax2.set_ylim([-50, 150])
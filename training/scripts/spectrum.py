@@ -0,0 +1,181 @@
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of OpenCPI <http://www.opencpi.org>
+#
+# OpenCPI is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# OpenCPI is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+spectrum: Streaming spectral measurements of iqstream captures.
+
+ToneMeter measures a few frequencies of interest (Goertzel style: one DFT
+bin per frequency, at any frequency rather than on the FFT grid) block by
+block, so checking a tone costs O(N) per frequency with constant memory no
+matter how long the capture is. A tone that holds more than half of the
+signal's energy is necessarily the peak of a full-length FFT (Parseval), so
+"is the peak at f?" needs no FFT at all:
+
+    meter = spectrum.measure(data, [0.0], sample_rate)
+    if meter.fraction()[0] > 0.5: ...
+
+WelchPSD is an averaged periodogram for plotting: windowed, overlapping
+nfft-point FFTs accumulated block by block from a memory-mapped capture, so
+the estimate is smooth and memory stays at a few nfft-sized arrays however
+long the capture is:
+
+    psd = spectrum.welch(data, 4096, sample_rate)
+    freqs, power = psd.shifted()
+
+estimate_frequency() locates a tone to a fraction of a bin from one short
+FFT, with a stated error bound, so a frequency check needs a few thousand
+samples rather than an FFT fine enough to hit the tone exactly.
+"""
+import numpy as np
+import iqstream
+
+class ToneMeter(object):
+    """Streaming DFT at a fixed set of frequencies.
+
+    Feed complex blocks of any length with update(); the twiddle factors for
+    one block are computed once and rotated to each block's start.
+    """
+    def __init__(self, freqs, sample_rate=1.0, block_size=1<<16):
+        self.freqs = np.atleast_1d(np.asarray(freqs, dtype=np.float64))
+        self.omega = 2*np.pi*self.freqs/sample_rate
+        self.block_size = block_size
+        self.twiddle = np.exp(-1j*np.outer(self.omega, np.arange(block_size)))
+        self.acc = np.zeros(len(self.freqs), dtype=np.complex128)
+        self.count = 0
+        self.energy = 0.0
+
+    def update(self, x):
+        x = np.ascontiguousarray(x)
+        for start in range(0, len(x), self.block_size):
+            block = x[start:start+self.block_size]
+            n = len(block)
+            rot = np.exp(-1j*self.omega*self.count)
+            self.acc += rot * self.twiddle[:, 0:n].dot(block)
+            self.energy += np.vdot(block, block).real
+            self.count += n
+
+    def update_iq(self, data):
+        """Feed an iqstream array (converted one block at a time)"""
+        for start, block in iqstream.iter_blocks(data, self.block_size):
+            self.update(iqstream.to_complex(block, dtype=np.complex128))
+
+    def power(self):
+        """Mean-square amplitude of the tone at each frequency"""
+        return np.abs(self.acc)**2 / max(self.count, 1)**2
+
+    def fraction(self):
+        """Share of the total energy in each frequency's bin (0 to 1)"""
+        if not self.energy:
+            return np.zeros(len(self.freqs))
+        return np.abs(self.acc)**2 / (self.count * self.energy)
+
+def measure(data, freqs, sample_rate=1.0, block_size=1<<16):
+    """ToneMeter over a whole iqstream array"""
+    meter = ToneMeter(freqs, sample_rate, block_size)
+    meter.update_iq(data)
+    return meter
+
+class WelchPSD(object):
+    """Streaming Welch (averaged periodogram) estimate.
+
+    Blocks of any length are fed with update(); the samples that do not
+    complete a segment are carried over to the next block. The result is
+    scaled so that a tone of amplitude A reads A**2 at its bin, the level a
+    plain |FFT|/N plot would show in dB.
+    """
+    def __init__(self, nfft=4096, sample_rate=1.0, overlap=0.5, window=None):
+        self.nfft = nfft
+        self.sample_rate = sample_rate
+        self.window = np.hanning(nfft) if window is None else np.asarray(window)
+        self.scale = 1.0 / self.window.sum()**2
+        self.step = max(nfft - int(nfft*overlap), 1)
+        self.carry = None
+        self.acc = np.zeros(nfft)
+        self.segments = 0
+
+    def update(self, x):
+        x = np.ascontiguousarray(x)
+        if self.carry is not None and len(self.carry):
+            x = np.concatenate((self.carry, x))
+        if len(x) < self.nfft:
+            self.carry = x
+            return
+        nseg = (len(x) - self.nfft) // self.step + 1
+        # overlapping segments as a strided view, then one batched FFT
+        segs = np.lib.stride_tricks.as_strided(
+            x, shape=(nseg, self.nfft), strides=(x.strides[0]*self.step, x.strides[0]))
+        self.acc += (np.abs(np.fft.fft(segs * self.window, axis=1))**2).sum(axis=0)
+        self.segments += nseg
+        self.carry = x[nseg*self.step:].copy()
+
+    def update_iq(self, data, block_size=1<<16):
+        """Feed an iqstream array (converted one block at a time)"""
+        for start, block in iqstream.iter_blocks(data, block_size):
+            self.update(iqstream.to_complex(block, dtype=np.complex128))
+
+    def psd(self):
+        """Averaged power per FFT bin (np.fft.fft order)"""
+        return self.acc * self.scale / max(self.segments, 1)
+
+    def freqs(self):
+        return np.fft.fftfreq(self.nfft, 1.0/self.sample_rate)
+
+    def shifted(self):
+        """(freqs, psd) with 0 Hz in the middle, for plotting"""
+        return np.fft.fftshift(self.freqs()), np.fft.fftshift(self.psd())
+
+def welch(data, nfft=4096, sample_rate=1.0, overlap=0.5, block_size=1<<16):
+    """WelchPSD over an iqstream array or a real/complex sample array.
+
+    nfft is reduced to the data length for short captures.
+    """
+    nfft = max(min(nfft, len(data)), 1)
+    psd = WelchPSD(nfft, sample_rate, overlap)
+    if np.asarray(data[0:0]).dtype.names is not None:
+        psd.update_iq(data, block_size)
+    else:
+        for start in range(0, len(data), block_size):
+            psd.update(np.asarray(data[start:start+block_size], dtype=np.float64))
+    return psd
+
+# Worst-case bias of parabolic interpolation of a Hann-windowed peak's log
+# magnitude, in bins (0.016 for a clean tone, rounded up)
+HANN_INTERP_BIAS = 0.02
+
+def estimate_frequency(data, sample_rate=1.0, nfft=4096):
+    """Frequency of the strongest tone in the first nfft samples.
+
+    data is an iqstream array or a complex sample array. The Hann-windowed
+    FFT peak is refined by fitting a parabola through the log magnitudes of
+    the peak bin and its neighbours. Returns (freq, bound) with freq in
+    [-sample_rate/2, sample_rate/2) and bound the worst-case error of the
+    interpolation for a single clean tone.
+    """
+    nfft = max(min(nfft, len(data)), 3)
+    x = data[0:nfft]
+    if np.asarray(x[0:0]).dtype.names is not None:
+        x = iqstream.to_complex(x, dtype=np.complex128)
+    X = np.abs(np.fft.fft(x * np.hanning(len(x)), nfft))
+    k = int(np.argmax(X))
+    tiny = 1e-300
+    a, b, c = np.log(X[[(k-1) % nfft, k, (k+1) % nfft]] + tiny)
+    den = a - 2*b + c
+    delta = 0.5*(a - c)/den if den else 0.0
+    bin_hz = float(sample_rate)/nfft
+    freq = ((k + delta)/nfft + 0.5) % 1.0 - 0.5
+    return freq*sample_rate, HANN_INTERP_BIAS*bin_hz
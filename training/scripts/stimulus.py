@@ -0,0 +1,355 @@
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of OpenCPI <http://www.opencpi.org>
+#
+# OpenCPI is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# OpenCPI is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+stimulus: Block-wise synthesis of complex test stimulus for the generators.
+
+A Scenario is a sum of sources (Tone, Chirp, Noise) times an optional
+amplitude envelope (Profile), produced one block at a time:
+- tones and chirps run from a phase accumulator in cycles, so the phase is
+  exact at any sample index and does not drift on long runs the way
+  2*pi*f*t does with a float time vector,
+- sample counts are integers, never derived from np.arange(0, N*Ts, Ts),
+- memory is bounded by the block size, so a billion-sample stimulus streams
+  straight to disk through iqstream.IqstreamWriter.
+
+Scenarios can also be written as text (see parse_scenario), e.g.
+    tone:12.5,tone:30:0.5,chirp:-40:40:0.25:16384,noise:0.01:7
+
+A Profile is a declarative amplitude envelope: a list of steps, linear ramps
+and exponential fades (Profile.parse), evaluated for a whole block of
+samples at once. write_profiled_tone() writes a tone shaped by a profile;
+constant steps take the tiled fast path below, so a profile of thousands of
+steps over hundreds of millions of samples is written quickly.
+
+A tone whose frequency is a rational fraction p/q of the sample rate repeats
+exactly every q samples. write_tone() then synthesizes and quantizes a single
+period and writes the file by repeating one buffer of whole periods, so large
+stimulus files are produced at disk speed without computing cos/sin per
+sample.
+"""
+from fractions import Fraction
+import numpy as np
+import iqstream
+
+class Tone(object):
+    """exp(j*(2*pi*freq*n/Fs + phase)) scaled by amplitude"""
+    def __init__(self, freq, amplitude=1.0, phase=0.0):
+        self.freq = float(freq)
+        self.amplitude = float(amplitude)
+        self.phase = float(phase)
+
+    def reset(self, sample_rate):
+        self.inc = self.freq / sample_rate     # cycles per sample
+        self.cycles = self.phase / (2*np.pi)   # accumulator, in [0, 1)
+
+    def block(self, count):
+        cycles = self.cycles + self.inc*np.arange(count)
+        self.cycles = (self.cycles + self.inc*count) % 1.0
+        return self.amplitude*np.exp(2j*np.pi*cycles)
+
+class Chirp(object):
+    """Linear sweep from f0 to f1 over length samples, then again from f0"""
+    def __init__(self, f0, f1, amplitude=1.0, length=65536):
+        self.f0 = float(f0)
+        self.f1 = float(f1)
+        self.amplitude = float(amplitude)
+        self.length = int(length)
+
+    def reset(self, sample_rate):
+        self.sample_rate = float(sample_rate)
+        self.n = 0
+        self.cycles = 0.0
+
+    def block(self, count):
+        pos = (self.n + np.arange(count)) % self.length
+        inc = (self.f0 + (self.f1 - self.f0)*pos/self.length) / self.sample_rate
+        step = np.cumsum(inc)
+        cycles = self.cycles + np.concatenate(([0.0], step[:-1]))
+        self.cycles = (self.cycles + step[-1]) % 1.0 if count else self.cycles
+        self.n += count
+        return self.amplitude*np.exp(2j*np.pi*cycles)
+
+class Noise(object):
+    """Complex white Gaussian noise of rms amplitude, from a seeded generator.
+
+    Samples are drawn in order, so the output does not depend on the block
+    size.
+    """
+    def __init__(self, amplitude, seed=0):
+        self.amplitude = float(amplitude)
+        self.seed = int(seed)
+
+    def reset(self, sample_rate):
+        self.rng = np.random.RandomState(self.seed)
+
+    def block(self, count):
+        v = self.rng.standard_normal((count, 2)) * (self.amplitude/np.sqrt(2))
+        return v[:, 0] + 1j*v[:, 1]
+
+class Profile(object):
+    """Amplitude envelope of (length, a0, a1, shape) segments.
+
+    shape is 'step' (a0 throughout), 'ramp' (linear from a0 to a1) or 'fade'
+    (exponential from a0 to a1, i.e. linear in dB). After the last segment the
+    final amplitude holds.
+    """
+    def __init__(self, segments):
+        self.segments = [(int(length), float(a0), float(a1), shape)
+                         for length, a0, a1, shape in segments]
+        self.ends = np.cumsum([seg[0] for seg in self.segments])
+        self.starts = self.ends - [seg[0] for seg in self.segments]
+        self.a0 = np.array([seg[1] for seg in self.segments])
+        self.a1 = np.array([seg[2] for seg in self.segments])
+        self.fade = np.array([seg[3] == 'fade' for seg in self.segments])
+        self.const = np.array([seg[3] == 'step' for seg in self.segments])
+
+    @classmethod
+    def parse(cls, text, num_samples):
+        """Profile from comma separated segments LENGTH@AMP (step),
+        LENGTH@A0>A1 (ramp) or LENGTH@A0>>A1 (fade). LENGTH is a number of
+        samples or P% of num_samples; percentage boundaries fall on
+        floor(num_samples*P/100). A trailing *R repeats the list R times.
+        """
+        repeat = 1
+        if '*' in text:
+            text, repeat = text.rsplit('*', 1)
+            repeat = int(repeat)
+        segments = []
+        percent = 0.0
+        for item in text.split(','):
+            length, amp = item.strip().split('@')
+            if length.endswith('%'):
+                begin = int(num_samples*percent/100)
+                percent += float(length[:-1])
+                length = int(num_samples*percent/100) - begin
+            if '>>' in amp:
+                a0, a1 = amp.split('>>')
+                segments.append((length, a0, a1, 'fade'))
+            elif '>' in amp:
+                a0, a1 = amp.split('>')
+                segments.append((length, a0, a1, 'ramp'))
+            else:
+                segments.append((length, amp, amp, 'step'))
+        return cls(segments * repeat)
+
+    @classmethod
+    def steps(cls, segments):
+        """Profile of constant (length, amplitude) steps"""
+        return cls([(length, a, a, 'step') for length, a in segments])
+
+    def reset(self, sample_rate):
+        self.n = 0
+
+    def peak(self):
+        return max(self.a0.max(), self.a1.max()) if len(self.segments) else 1.0
+
+    def values(self, start, count):
+        """Envelope for samples [start, start+count)"""
+        n = start + np.arange(count)
+        idx = np.searchsorted(self.ends, n, side='right')
+        held = idx >= len(self.segments)
+        idx = np.minimum(idx, len(self.segments)-1)
+        t = (n - self.starts[idx]) / np.maximum(self.ends[idx] - self.starts[idx], 1).astype(np.float64)
+        t[held] = 1.0
+        a0, a1 = self.a0[idx], self.a1[idx]
+        env = a0 + (a1 - a0)*t
+        fade = self.fade[idx] & (a0 > 0) & (a1 > 0)
+        env[fade] = a0[fade] * (a1[fade]/a0[fade])**t[fade]
+        step = self.const[idx]
+        env[step] = a0[step]
+        return env
+
+    def block(self, count):
+        env = self.values(self.n, count)
+        self.n += count
+        return env
+
+    def pieces(self, num_samples):
+        """(start, stop, constant amplitude or None) covering [0, num_samples)"""
+        for k, (length, a0, a1, shape) in enumerate(self.segments):
+            start = self.starts[k]
+            stop = min(self.ends[k], num_samples)
+            if start >= num_samples:
+                return
+            if stop > start:
+                yield start, stop, a0 if shape == 'step' else None
+        end = self.ends[-1] if len(self.segments) else 0
+        if end < num_samples:
+            yield end, num_samples, self.a1[-1] if len(self.segments) else 1.0
+
+class Scenario(object):
+    """Sum of sources times an optional envelope"""
+    def __init__(self, sources, envelope=None):
+        self.sources = list(sources)
+        self.envelope = envelope
+
+    def peak(self):
+        """Upper bound of |sample| from the tone/chirp amplitudes (noise excluded)"""
+        peak = sum(abs(s.amplitude) for s in self.sources if not isinstance(s, Noise))
+        if self.envelope is not None:
+            peak *= self.envelope.peak()
+        return peak or 1.0
+
+    def blocks(self, num_samples, sample_rate, block_size=1<<16):
+        """Yield complex128 blocks totalling exactly num_samples samples"""
+        for s in self.sources:
+            s.reset(sample_rate)
+        if self.envelope is not None:
+            self.envelope.reset(sample_rate)
+        for start in range(0, num_samples, block_size):
+            count = min(block_size, num_samples - start)
+            x = np.zeros(count, dtype=np.complex128)
+            for s in self.sources:
+                x += s.block(count)
+            if self.envelope is not None:
+                x *= self.envelope.block(count)
+            yield x
+
+def parse_scenario(text):
+    """Scenario from a comma separated list of sources:
+
+    tone:FREQ[:AMPLITUDE[:PHASE]]
+    chirp:F0:F1[:AMPLITUDE[:LENGTH]]
+    noise:RMS[:SEED]
+    steps:LENGTH:AMPLITUDE[:LENGTH:AMPLITUDE...]   (envelope)
+    """
+    sources = []
+    envelope = None
+    for item in text.split(','):
+        fields = item.strip().split(':')
+        kind, args = fields[0].lower(), [float(v) for v in fields[1:]]
+        if kind == 'tone':
+            sources.append(Tone(*args))
+        elif kind == 'chirp':
+            sources.append(Chirp(*args))
+        elif kind == 'noise':
+            sources.append(Noise(*args))
+        elif kind == 'steps':
+            envelope = Profile.steps(zip(args[0::2], args[1::2]))
+        else:
+            raise ValueError("Unknown stimulus source '%s'" % fields[0])
+    return Scenario(sources, envelope)
+
+def quantize(x, full_scale, rounding=None):
+    """I/Q rails of x scaled by full_scale and limited to the int16 range.
+
+    Without rounding the int16 conversion in IqstreamWriter truncates as
+    np.int16() does; pass rounding=np.rint to round instead.
+    """
+    limit = np.iinfo(np.int16).max
+    real, imag = x.real*full_scale, x.imag*full_scale
+    if rounding is not None:
+        real, imag = rounding(real), rounding(imag)
+    return np.clip(real, -limit-1, limit), np.clip(imag, -limit-1, limit)
+
+def write_stimulus(filename, blocks, full_scale, rounding=None):
+    """Write complex blocks (scaled by full_scale) to an iqstream capture"""
+    with iqstream.IqstreamWriter(filename) as w:
+        for x in blocks:
+            w.write(*quantize(x, full_scale, rounding))
+    return w.num_samples
+
+def tone_period(freq, sample_rate, max_period=1<<16):
+    """Samples per period of a tone, or None if it does not repeat within max_period"""
+    ratio = float(freq) / sample_rate
+    r = Fraction(ratio).limit_denominator(max_period)
+    if abs(float(r) - ratio) > 1e-12:
+        return None
+    return r.denominator
+
+def tone_cycle(freq, sample_rate, period):
+    """One period of exp(j*2*pi*freq*n/Fs), with each phase reduced exactly"""
+    k = int(round(float(freq) / sample_rate * period))
+    n = np.arange(period, dtype=np.int64)
+    return np.exp(2j*np.pi*((n*k) % period)/period)
+
+def write_periodic(w, words, count, start=0, block_size=1<<16):
+    """Write words [start, start+count) of a sequence repeating words forever.
+
+    One buffer of whole periods (at least block_size long) is built and
+    written repeatedly, so the phase carries over between writes.
+    """
+    period = len(words)
+    buf = np.roll(words, -(start % period))
+    buf = np.tile(buf, max(-(-block_size // period), 1))
+    for k in range(count // len(buf)):
+        w.write_words(buf)
+    w.write_words(buf[0:count % len(buf)])
+
+def write_tone(w, freq, sample_rate, count, scale, start=0, max_period=1<<16):
+    """Write count samples of a tone, from sample index start, to IqstreamWriter w.
+
+    scale(x) turns complex samples into the (I, Q) rails to write. Periodic
+    tones are scaled for one period and tiled; other tones are synthesized
+    block by block.
+    """
+    period = tone_period(freq, sample_rate, max_period)
+    if period is not None:
+        write_periodic(w, w.pack(*scale(tone_cycle(freq, sample_rate, period))), count, start)
+        return
+    tone = Tone(freq)
+    tone.reset(sample_rate)
+    tone.cycles = (tone.inc * start) % 1.0
+    for begin in range(0, count, 1<<16):
+        w.write(*scale(tone.block(min(1<<16, count - begin))))
+
+def write_profiled_tone(w, freq, sample_rate, num_samples, profile, full_scale,
+                        rounding=np.rint, block_size=1<<16):
+    """Write a tone shaped by a Profile, quantized as rounding(x*full_scale*env).
+
+    Constant steps go through write_tone() (tiled when the tone is periodic);
+    ramps and fades are written block by block. Like write_stimulus(), both
+    go through quantize(), so amplitudes above 1 clip at the int16 limits
+    instead of wrapping.
+    """
+    period = tone_period(freq, sample_rate)
+    cycle = tone_cycle(freq, sample_rate, period) if period is not None else None
+    for start, stop, amplitude in profile.pieces(num_samples):
+        if amplitude is not None:
+            gain = full_scale*amplitude
+            write_tone(w, freq, sample_rate, stop-start,
+                       lambda x: quantize(x, gain, rounding), start)
+            continue
+        for begin in range(start, stop, block_size):
+            count = min(block_size, stop - begin)
+            x = tone_samples(freq, sample_rate, begin, count, cycle)
+            gain = full_scale*profile.values(begin, count)
+            w.write(*quantize(x, gain, rounding))
+
+def tone_samples(freq, sample_rate, start, count, cycle=None):
+    """Tone samples [start, start+count), from one period (cycle) if given"""
+    n = start + np.arange(count, dtype=np.int64)
+    if cycle is not None:
+        return cycle[n % len(cycle)]
+    return np.exp(2j*np.pi*((float(freq)/sample_rate*n) % 1.0))
+
+def tone_blocks(freq, sample_rate, num_samples, profile=None, block_size=1<<16):
+    """Yield complex blocks of a unit tone, times a Profile if given.
+
+    This is the unquantized form of write_tone()/write_profiled_tone(), for
+    generators that pass the signal through further stages first.
+    """
+    period = tone_period(freq, sample_rate)
+    cycle = tone_cycle(freq, sample_rate, period) if period is not None else None
+    for begin in range(0, num_samples, block_size):
+        count = min(block_size, num_samples - begin)
+        x = tone_samples(freq, sample_rate, begin, count, cycle)
+        if profile is not None:
+            x = x * profile.values(begin, count)
+        yield x
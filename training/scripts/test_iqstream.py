@@ -0,0 +1,48 @@
+# This file is protected by Copyright. Please refer to the COPYRIGHT file
+# distributed with this source distribution.
+#
+# This file is part of OpenCPI <http://www.opencpi.org>
+#
+# OpenCPI is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# OpenCPI is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along
+# with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Checks of the shared iqstream helpers.
+
+Run from this directory with: python -m unittest test_iqstream
+"""
+import unittest
+
+import numpy as np
+
+import iqstream
+
+class TestCompareWords(unittest.TestCase):
+    def test_unequal_lengths(self):
+        # Only the common length is compared, in every chunk
+        a = np.arange(10, dtype=np.uint32)
+        b = np.arange(7, dtype=np.uint32)
+        self.assertEqual(iqstream.compare_words(a, b, chunk_size=4), (7, 0, None))
+        self.assertEqual(iqstream.compare_words(b, a, chunk_size=4), (7, 0, None))
+
+    def test_first_mismatch(self):
+        a = np.arange(10, dtype=np.uint32)
+        b = a[0:9].copy()
+        b[5] += 1
+        b[8] += 1
+        self.assertEqual(iqstream.compare_words(a, b, chunk_size=4), (8, 1, 5))
+        self.assertEqual(iqstream.compare_words(a, b, chunk_size=4, early_exit=False),
+                         (9, 2, 5))
+
+if __name__ == '__main__':
+    unittest.main()